@@ -0,0 +1,91 @@
+"""
+Concurrent start/stop of the recording devices with timestamps for the session sidecar.
+
+Every device command runs in its own thread, all threads are released together by a barrier so Aria and OBS get
+their commands at the same instant instead of one after the other. For each command the time it was sent and the time
+the call returned (acknowledged) are recorded on the monotonic clock (time.perf_counter_ns, for differences) and the
+wall clock (time.time_ns, to match file times). Instants such as the sync beeps are recorded with mark().
+
+The controller only calls the functions it is given, so any object can stand in for a device:
+    log = SessionLog('P1_T1')
+    log.run('start', {'aria': aria_glass.start_recording, 'obs': lambda: obs.start_recording('P1_T1')})
+    log.mark('beep')
+    ...
+    log.save('P1_T1_session.json')
+
+Sidecar JSON (copied next to obs.mp4 as session.json, see data_processing/sync_vids.py --sidecar):
+{
+    "name": "P1_T1",
+    "events": [
+        {"device": "aria", "command": "start", "sent_mono_ns": ..., "sent_wall_ns": ..., "ack_mono_ns": ...,
+         "ack_wall_ns": ..., "error": null},
+        {"device": "host", "command": "beep", "mono_ns": ..., "wall_ns": ...},
+        ...
+    ]
+}
+"""
+import json
+import os
+import threading
+import time
+
+
+class SessionLog:
+    def __init__(self, name):
+        self.name = name
+        self.events = []
+        self.lock = threading.Lock()
+
+    def _record(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def mark(self, label):
+        """Record an instant (e.g. the sync beep) on both clocks."""
+        self._record({'device': 'host', 'command': label, 'mono_ns': time.perf_counter_ns(),
+                      'wall_ns': time.time_ns()})
+
+    def run(self, command, calls):
+        """Call every function of calls (device name -> function) at the same time and wait for all of them.
+        Every call is recorded, the first error is raised once all calls returned."""
+        barrier = threading.Barrier(len(calls))
+        errors = {}
+
+        def call(device, func):
+            barrier.wait()
+            event = {'device': device, 'command': command, 'sent_mono_ns': time.perf_counter_ns(),
+                     'sent_wall_ns': time.time_ns()}
+            try:
+                func()
+            except BaseException as e:
+                errors[device] = e
+            event.update({'ack_mono_ns': time.perf_counter_ns(), 'ack_wall_ns': time.time_ns(),
+                          'error': repr(errors[device]) if device in errors else None})
+            self._record(event)
+
+        threads = [threading.Thread(target=call, args=item) for item in calls.items()]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for device, event in self.latest(command).items():
+            print(f"[INFO] {device} {command}: acknowledged after "
+                  f"{(event['ack_mono_ns'] - event['sent_mono_ns']) / 1e6:.1f}ms")
+        if errors:
+            device, error = next(iter(errors.items()))
+            raise RuntimeError(f'{device} failed to {command}: {error}') from error
+
+    def latest(self, command):
+        """Last event of command for every device."""
+        with self.lock:
+            return {e['device']: e for e in self.events if e['command'] == command}
+
+    def save(self, path):
+        with self.lock:
+            data = {'name': self.name, 'events': sorted(self.events, key=lambda e: e.get('sent_mono_ns', e.get('mono_ns')))}
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, path)
+        print(f'[INFO] Saved session timestamps to {path}')
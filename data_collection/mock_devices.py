@@ -0,0 +1,105 @@
+"""
+Stand-ins for the Aria and OBS classes of script.py, to run orchestrator.py, controller.py and telemetry.py without
+hardware (orchestrator.py --mock).
+
+They keep the same interface and only simulate the latency and the state of the devices. A station config entry can
+make them fail to test how failures are isolated:
+    {"name": "station2", ..., "mock_fail": "connect" | "start" | "stop"}
+"""
+import os
+import threading
+import time
+import types
+
+
+class MockError(RuntimeError):
+    pass
+
+
+class MockAria:
+    def __init__(self, ip, profile, fail=None, latency=0.05):
+        self.ip, self.profile, self.fail, self.latency = ip, profile, fail, latency
+        self.recording = False
+        self.battery = 100
+        self._step('connect')
+        self.device = self
+        self.recording_manager = self
+        print(f'[INFO] Mock Aria {ip or "USB"} connected with {profile}')
+
+    def _step(self, command):
+        time.sleep(self.latency)
+        if self.fail == command:
+            raise MockError(f'Mock Aria {self.ip} failed to {command}')
+
+    @property
+    def status(self):
+        return types.SimpleNamespace(battery_level=self.battery, device_mode='Mock')
+
+    @property
+    def recording_state(self):
+        return 'Recording' if self.recording else 'Idle'
+
+    def check_idle(self):
+        if self.recording:
+            raise RuntimeError('Glasses are already recording. Use app to stop recording first')
+
+    def start_recording(self, check=True):
+        if check:
+            self.check_idle()
+        self._step('start')
+        self.recording = True
+
+    def stop_recording(self):
+        self._step('stop')
+        self.recording = False
+
+    def is_recording(self):
+        return self.recording
+
+    def disconnect(self):
+        print(f'[INFO] Disconnected from mock Aria {self.ip}')
+
+
+class MockOBS:
+    def __init__(self, host='localhost', port=4455, password=None, fail=None, latency=0.02):
+        self.host, self.port, self.fail, self.latency = host, port, fail, latency
+        self.recording_since = None
+        self.lock = threading.Lock()
+        self._step('connect')
+        self.client = self
+
+    def _step(self, command):
+        time.sleep(self.latency)
+        if self.fail == command:
+            raise MockError(f'Mock OBS {self.host}:{self.port} failed to {command}')
+
+    def set_file_name(self, file_name):
+        self.file_name = file_name
+
+    def start_recording(self, file_name=None):
+        if file_name:
+            self.set_file_name(file_name)
+        self._step('start')
+        with self.lock:
+            self.recording_since = time.monotonic()
+
+    def stop_recording(self):
+        self._step('stop')
+        with self.lock:
+            self.recording_since = None
+
+    def record_directory(self):
+        return os.getcwd()
+
+    # obsws_python.ReqClient requests used by telemetry.py
+    def get_record_status(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.recording_since if self.recording_since else 0
+        return types.SimpleNamespace(output_active=self.recording_since is not None, output_duration=elapsed * 1000,
+                                     output_bytes=int(elapsed * 2_500_000))
+
+    def get_stats(self):
+        with self.lock:
+            frames = int((time.monotonic() - self.recording_since) * 30) if self.recording_since else 0
+        return types.SimpleNamespace(output_skipped_frames=0, output_total_frames=frames, render_skipped_frames=0,
+                                     render_total_frames=frames, active_fps=30.0, available_disk_space=100000.0)
@@ -0,0 +1,214 @@
+"""
+Drive several recording stations (one Aria + one OBS each) from one process.
+
+Stations are listed in a JSON config:
+{
+    "stations": [
+        {"name": "station1", "aria_ip": "192.168.8.6", "profile": "profile28",
+         "obs_host": "192.168.1.126", "obs_port": 4455, "obs_password_env": "OBS_PASSWORD_STATION1"},
+        {"name": "station2", "aria_ip": "", "profile": "profile28", "obs_host": "localhost"}
+    ]
+}
+An empty aria_ip uses the USB connection. The OBS password is read from the environment variable named by
+obs_password_env (or given directly as obs_password), so it does not need to be committed with the config.
+
+The connection to every Aria and OBS websocket is opened once and kept for all recordings of the run (a connection
+that failed is opened again before the next recording). Start and stop run on all stations at the same time, each
+station starting its Aria and OBS together (see controller.py). A station that fails is reported and left out, the
+others keep recording. Every station gets its own <station>_<name>_session.json in --output.
+
+Usage:
+python orchestrator.py -c stations.json -n P1_T1
+python orchestrator.py -c stations.json -n P1_T1 --mock    <- mock_devices.py instead of hardware
+After a recording is stopped, the name of the next one is asked, the connections stay open in between.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from controller import SessionLog
+
+parser = argparse.ArgumentParser(description='Record on several Aria + OBS stations at once')
+parser.add_argument('-c', '--config', type=str, required=True, help='Station config (JSON)')
+parser.add_argument('-n', '--name', type=str, default='test', help='Name of the recording files')
+parser.add_argument('-o', '--output', type=str, default='.', help='Folder of the session sidecars')
+parser.add_argument('--mock', action='store_true', help='Use mock devices instead of the real Aria and OBS')
+parser.add_argument('--no-beep', action='store_true', help='Do not play the synchronization beeps')
+
+
+def load_stations(path):
+    with open(path) as f:
+        stations = json.load(f)['stations']
+    names = [station['name'] for station in stations]
+    if len(set(names)) != len(names):
+        raise ValueError(f'Station names must be unique: {names}')
+    return stations
+
+
+class Station:
+    def __init__(self, config, aria_cls, obs_cls, mock=False):
+        self.config, self.aria_cls, self.obs_cls, self.mock = config, aria_cls, obs_cls, mock
+        self.name = config['name']
+        self.aria = self.obs = None
+        self.log = None
+        self.status, self.error = 'idle', None
+
+    def _kwargs(self):
+        return {'fail': self.config.get('mock_fail')} if self.mock else {}
+
+    def connect(self):
+        """Open the connections that are not open yet."""
+        if self.aria is None:
+            self.aria = self.aria_cls(self.config.get('aria_ip', ''), self.config.get('profile', 'profile28'),
+                                      **self._kwargs())
+        if self.obs is None:
+            password = self.config.get('obs_password') or os.environ.get(self.config.get('obs_password_env', ''))
+            self.obs = self.obs_cls(self.config.get('obs_host', 'localhost'), self.config.get('obs_port', 4455),
+                                    password, **self._kwargs())
+        self.status = 'connected'
+
+    def start(self, name):
+        self.log = SessionLog(f'{self.name}_{name}')
+        # Outside of the timed start, which only sends the start command to each device
+        self.aria.check_idle()
+        self.obs.set_file_name(name)
+        try:
+            self.log.run('start', {'aria': lambda: self.aria.start_recording(check=False),
+                                   'obs': self.obs.start_recording})
+        except RuntimeError:
+            # Do not leave one device of the station recording alone
+            started = {'aria': self.aria.stop_recording, 'obs': self.obs.stop_recording}
+            for device, event in self.log.latest('start').items():
+                if event['error'] is None:
+                    started[device]()
+            raise
+        self.status = 'recording'
+
+    def stop(self):
+        self.log.run('stop', {'aria': self.aria.stop_recording, 'obs': self.obs.stop_recording})
+        self.status = 'stopped'
+
+    def reset(self):
+        """Drop the connections after a failure, connect() opens them again."""
+        if self.aria is not None:
+            try:
+                self.aria.disconnect()
+            except Exception:
+                pass
+        self.aria = self.obs = None
+
+    def close(self):
+        if self.aria is not None:
+            self.aria.disconnect()
+        self.aria = self.obs = None
+
+
+class Orchestrator:
+    def __init__(self, stations, aria_cls, obs_cls, mock=False):
+        self.stations = [Station(config, aria_cls, obs_cls, mock) for config in stations]
+        self.pool = ThreadPoolExecutor(max_workers=max(1, len(self.stations)))
+
+    def run(self, action, stations, *args):
+        """Run action on every station at the same time. A failing station is marked failed, the others go on."""
+        def call(station):
+            try:
+                getattr(station, action)(*args)
+                station.error = None
+            except Exception as e:
+                station.status, station.error = 'failed', f'{action}: {e}'
+                if action != 'stop':
+                    station.reset()
+
+        list(self.pool.map(call, stations))
+        self.print_status()
+
+    def mark(self, label, stations):
+        for station in stations:
+            if station.log is not None:
+                station.log.mark(label)
+
+    def save(self, output_dir, stations):
+        os.makedirs(output_dir, exist_ok=True)
+        for station in stations:
+            if station.log is not None:
+                station.log.save(os.path.join(output_dir, f'{station.log.name}_session.json'))
+
+    def print_status(self):
+        for station in self.stations:
+            print(f'    {station.name:<16} {station.status:<10} {station.error or ""}')
+
+    def close(self):
+        for station in self.stations:
+            try:
+                station.close()
+            except Exception as e:
+                print(f'[WARNING] {station.name}: {e}')
+        self.pool.shutdown()
+
+
+def beep():
+    import beepy
+    beepy.beep(sound=5)
+
+
+def record(orchestrator, name, args):
+    """One recording on every station that can connect. Return False if no station recorded."""
+    print('[INFO] Connecting...')
+    # Open connections are kept, stations that failed before are connected again
+    orchestrator.run('connect', orchestrator.stations)
+    recording = [station for station in orchestrator.stations if station.status == 'connected']
+    if not recording:
+        print('[ERROR] No station connected')
+        return False
+
+    print(f'[INFO] Starting {name}...')
+    orchestrator.run('start', recording, name)
+    recording = [station for station in recording if station.status == 'recording']
+    if not recording:
+        print('[ERROR] No station started recording')
+        return False
+
+    time.sleep(1)
+    # One host plays the beep for every station in the room
+    orchestrator.mark('beep', recording)
+    if not args.no_beep:
+        beep()
+
+    print(f"\n[INFO] Recording on {len(recording)} station(s). Press 'q' and Enter to stop recording...")
+    while input().lower() != 'q':
+        pass
+
+    print('[INFO] Stopping...')
+    orchestrator.mark('beep', recording)
+    if not args.no_beep:
+        beep()
+    orchestrator.run('stop', recording)
+    orchestrator.save(args.output, recording)
+    return True
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    if args.mock:
+        from mock_devices import MockAria as Aria, MockOBS as OBS
+    else:
+        from script import Aria, OBS
+
+    orchestrator = Orchestrator(load_stations(args.config), Aria, OBS, args.mock)
+    name, failed = args.name, set()
+    try:
+        while name:
+            if not record(orchestrator, name, args):
+                failed.add(name)
+            failed.update(f'{station.name}/{name}' for station in orchestrator.stations if station.status == 'failed')
+            name = input('[INFO] Name of the next recording (Enter to quit): ').strip()
+    finally:
+        orchestrator.close()
+
+    if failed:
+        print(f'[ERROR] Failed: {sorted(failed)}')
+        exit(1)
+    print('[INFO] All recordings stopped successfully')
@@ -1,10 +1,14 @@
 import argparse
+import os
 import time
 
 import aria.sdk as aria
 import beepy
 import obsws_python as obs
 
+from controller import SessionLog
+from telemetry import TelemetrySampler, aria_probe, obs_probe
+
 DEFAULT_IP = '192.168.8.6'
 DEFAULT_PROFILE = 'profile28'
 
@@ -18,6 +22,17 @@ parser.add_argument('-wired', help="Use wired connection", action='store_true')
 parser.add_argument(
     "-profile", help="Profile to be used for streaming.", default=DEFAULT_PROFILE
 )
+parser.add_argument(
+    "--monitor", help="Live touch detection from this capture device index (e.g. OBS virtual camera) or video file",
+    default=None
+)
+parser.add_argument(
+    "--telemetry", help="Seconds between Aria/OBS health samples, 0 disables telemetry", type=float, default=5.0
+)
+parser.add_argument(
+    "--roi", help="LED search region in webcam2 coordinates for --monitor", type=int, nargs=4,
+    metavar=("X1", "Y1", "X2", "Y2")
+)
 
 aria.set_log_level(aria.Level.Info)
 
@@ -56,10 +71,15 @@ class Aria:
         self.device_client.disconnect(self.device)
         print("[INFO] Disconnected from Aria")
 
-    def start_recording(self):
+    def check_idle(self):
         if self.is_recording():
-            print("[WARNING] Glasses are already recording. Use app to stop recording first")
-            exit(1)
+            # Raised instead of exiting, start may run in a controller thread
+            raise RuntimeError("Glasses are already recording. Use app to stop recording first")
+
+    def start_recording(self, check=True):
+        # check=False when check_idle() was called before, so a timed start only sends the start command
+        if check:
+            self.check_idle()
 
         self.recording_manager.start_recording()
         print("[INFO] Started Aria recording")
@@ -73,35 +93,91 @@ class Aria:
 
 
 class OBS:
-    def __init__(self, host="localhost", port=4455):
-        self.client = obs.ReqClient(host=host, port=port)
+    def __init__(self, host="localhost", port=4455, password=None):
+        self.client = obs.ReqClient(host=host, port=port, password=password or "", timeout=10)
+        self.file_name = None
+
+    def set_file_name(self, file_name):
+        self.client.set_profile_parameter("Output", "FilenameFormatting", file_name)
+        self.file_name = file_name
 
     def start_recording(self, file_name=None):
+        # Give no file_name when set_file_name() was called before, so a timed start only sends the start request
         if file_name:
-            self.client.set_profile_parameter("Output", "FilenameFormatting", file_name)
+            self.set_file_name(file_name)
 
         self.client.start_record()
-        print(f"[INFO] Started OBS recording with output {file_name}")
+        print(f"[INFO] Started OBS recording with output {self.file_name}")
 
     def stop_recording(self):
         self.client.stop_record()
         print("[INFO] Stopped OBS recording")
 
+    def record_directory(self):
+        return self.client.get_record_directory().record_directory
+
 if __name__ == "__main__":
     args = parser.parse_args()
     if args.wired:
         print("[INFO] Using wired connection")
         args.ip = ''
 
-    aria_glass = Aria(args.ip, args.profile)
-    obs = OBS()
+    if args.monitor and not args.roi:
+        parser.error("--monitor requires --roi")
 
-    # Start recording on both devices
-    aria_glass.start_recording()
-    obs.start_recording(args.name)
+    aria_glass = Aria(args.ip, args.profile)
+    # Not named obs, that is the obsws_python module used by OBS()
+    obs_client = OBS()
+
+    monitor = None
+    if args.monitor:
+        # Only needed for live detection, recording alone does not depend on OpenCV
+        from touch_monitor import TouchMonitor
+        log_path = os.path.join(obs_client.record_directory(), f"{args.name}_touch_events.csv")
+        monitor = TouchMonitor(args.monitor, args.roi, log_path)
+
+    # Checks and settings go before the timed start, so both timed calls are a single device request
+    try:
+        aria_glass.check_idle()
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
+        exit(1)
+    obs_client.set_file_name(args.name)
+
+    # Start recording on both devices at the same time, every command and acknowledgement is timestamped
+    session_log = SessionLog(args.name)
+    sidecar_path = os.path.join(obs_client.record_directory(), f"{args.name}_session.json")
+    try:
+        session_log.run("start", {"aria": lambda: aria_glass.start_recording(check=False),
+                                  "obs": obs_client.start_recording})
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
+        # Do not leave the other device recording alone
+        started = {"aria": aria_glass.stop_recording, "obs": obs_client.stop_recording}
+        for device, event in session_log.latest("start").items():
+            if event["error"] is None:
+                started[device]()
+        session_log.save(sidecar_path)
+        exit(1)
+
+    if monitor:
+        monitor.start()
+    telemetry = None
+    if args.telemetry > 0:
+        # Both devices are recording now, a telemetry failure must not skip the stop below
+        try:
+            # Own OBS websocket client, the sampler thread must not share requests with the control loop
+            telemetry = TelemetrySampler({"aria": aria_probe(aria_glass), "obs": obs_probe(OBS().client)},
+                                         os.path.join(obs_client.record_directory(), f"{args.name}_telemetry.csv"),
+                                         args.telemetry)
+            telemetry.start()
+        except Exception as e:
+            print(f"[WARNING] Telemetry disabled, it failed to start: {e}")
+            telemetry = None
     time.sleep(1)
 
     # Play synchronization sound
+    session_log.mark("beep")
     beepy.beep(sound=5)
 
     # Clear any pending input
@@ -112,9 +188,14 @@ if __name__ == "__main__":
         if user_input == 'q':
             print("[INFO] Stopping recording...")
             try:
+                session_log.mark("beep")
                 beepy.beep(sound=5)
-                aria_glass.stop_recording()
-                obs.stop_recording()
+                if monitor:
+                    monitor.stop()
+                if telemetry:
+                    telemetry.stop()
+                session_log.run("stop", {"aria": aria_glass.stop_recording, "obs": obs_client.stop_recording})
+                session_log.save(sidecar_path)
                 aria_glass.disconnect()
 
                 print("[INFO] All recordings stopped successfully")
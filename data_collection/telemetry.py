@@ -0,0 +1,132 @@
+"""
+Recording health telemetry: Aria and OBS are polled in a background thread while recording.
+
+Every --telemetry seconds one row is appended to <name>_telemetry.csv next to the recording:
+    mono,wall,aria_state,battery,device_mode,obs_active,obs_duration_s,bitrate_kbps,output_skipped,output_total,
+    render_skipped,render_total,active_fps,disk_mb,error
+Counters (skipped/total frames) are cumulative as reported by OBS, bitrate is computed from the recorded bytes since the
+previous sample. A warning is printed when a limit is crossed (low battery, Aria or OBS not recording, frames skipped
+in the last interval, low disk space), once per crossing instead of every sample.
+
+Probes are plain functions returning a dict of the columns above, so the sampler runs with any stand-in device. The
+sampler uses its own OBS websocket client: requests from two threads on one client could interleave. A slow or failing
+probe only delays or blanks its own columns, the recording control loop never waits for the sampler.
+"""
+import csv
+import threading
+import time
+
+FIELDS = ['mono', 'wall', 'aria_state', 'battery', 'device_mode', 'obs_active', 'obs_duration_s', 'bitrate_kbps',
+          'output_skipped', 'output_total', 'render_skipped', 'render_total', 'active_fps', 'disk_mb', 'error']
+
+DEFAULT_LIMITS = {'min_battery': 20, 'max_skipped_ratio': 0.01, 'min_disk_mb': 5000}
+
+
+def aria_probe(aria_glass):
+    def probe():
+        status = aria_glass.device.status
+        return {'aria_state': str(aria_glass.recording_manager.recording_state).split('.')[-1],
+                'battery': status.battery_level, 'device_mode': str(status.device_mode).split('.')[-1]}
+    return probe
+
+
+def obs_probe(client):
+    """client: an obsws_python.ReqClient dedicated to telemetry."""
+    last = {}
+
+    def probe():
+        record = client.get_record_status()
+        stats = client.get_stats()
+        now = time.monotonic()
+        bitrate = None
+        if last and record.output_bytes >= last['bytes']:
+            bitrate = round((record.output_bytes - last['bytes']) * 8 / 1000 / (now - last['time']), 1)
+        last.update({'bytes': record.output_bytes, 'time': now})
+
+        return {'obs_active': record.output_active, 'obs_duration_s': round(record.output_duration / 1000, 1),
+                'bitrate_kbps': bitrate, 'output_skipped': stats.output_skipped_frames,
+                'output_total': stats.output_total_frames, 'render_skipped': stats.render_skipped_frames,
+                'render_total': stats.render_total_frames, 'active_fps': round(stats.active_fps, 2),
+                'disk_mb': round(stats.available_disk_space)}
+    return probe
+
+
+class TelemetrySampler:
+    def __init__(self, probes, path, interval=5.0, limits=None):
+        self.probes, self.path, self.interval = probes, path, interval
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.previous = None
+        self.warned = set()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print(f'[INFO] Telemetry every {self.interval}s to {self.path}')
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            # Daemon thread, do not hang the shutdown on a probe stuck on the network
+            self.thread.join(timeout=self.interval + 5)
+
+    def sample(self):
+        row = {'mono': round(time.monotonic(), 3), 'wall': round(time.time(), 3)}
+        errors = []
+        for name, probe in self.probes.items():
+            try:
+                row.update(probe())
+            except Exception as e:
+                errors.append(f'{name}: {e}')
+        row['error'] = '; '.join(errors) or None
+        return row
+
+    def check(self, row):
+        """Warnings for the limits crossed by row, compared with the previous sample for the frame counters."""
+        problems = {}
+        if row.get('battery') is not None and row['battery'] < self.limits['min_battery']:
+            problems['battery'] = f"Aria battery at {row['battery']}%"
+        if row.get('aria_state') is not None and row['aria_state'] != 'Recording':
+            problems['aria_state'] = f"Aria is not recording ({row['aria_state']})"
+        if row.get('obs_active') is False:
+            problems['obs_active'] = 'OBS is not recording'
+        if row.get('disk_mb') is not None and row['disk_mb'] < self.limits['min_disk_mb']:
+            problems['disk_mb'] = f"{row['disk_mb']}MB of disk space left"
+        if row['error']:
+            problems['error'] = f"Telemetry failed: {row['error']}"
+
+        previous = self.previous or {}
+        for kind in ['output', 'render']:
+            skipped, total = row.get(f'{kind}_skipped'), row.get(f'{kind}_total')
+            if skipped is None or previous.get(f'{kind}_skipped') is None:
+                continue
+            new_total = total - previous[f'{kind}_total']
+            new_skipped = skipped - previous[f'{kind}_skipped']
+            if new_total > 0 and new_skipped / new_total > self.limits['max_skipped_ratio']:
+                problems[kind] = f'OBS skipped {new_skipped}/{new_total} {kind} frames in the last {self.interval}s'
+
+        # Warn when a problem appears, not on every sample while it lasts
+        for key, message in problems.items():
+            if key not in self.warned:
+                print(f'[WARNING] {message}')
+        for key in self.warned - set(problems):
+            print(f'[INFO] Recovered: {key}')
+        self.warned = set(problems)
+
+    def _run(self):
+        with open(self.path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, FIELDS, extrasaction='ignore')
+            if f.tell() == 0:
+                writer.writeheader()
+
+            next_time = time.monotonic()
+            while not self.stop_event.is_set():
+                row = self.sample()
+                writer.writerow(row)
+                f.flush()
+                self.check(row)
+                self.previous = row
+
+                next_time += self.interval
+                self.stop_event.wait(max(0.0, next_time - time.monotonic()))
@@ -0,0 +1,178 @@
+"""
+Tests of controller.py with fake devices, no Aria or OBS needed:
+python -m pytest data_collection/test_controller.py    (or python -m unittest from data_collection)
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from controller import SessionLog
+from orchestrator import Station
+
+# sync_vids.py reads the sidecar back
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_processing'))
+
+
+class FakeDevice:
+    """Takes latency seconds to acknowledge a command, optionally failing one of them."""
+
+    def __init__(self, latency=0.02, fail=None):
+        self.latency, self.fail = latency, fail
+        self.recording = False
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _command(self, command):
+        with self.lock:
+            self.calls.append((command, time.perf_counter_ns()))
+        time.sleep(self.latency)
+        if self.fail == command:
+            raise ConnectionError(f'fake device failed to {command}')
+
+    def start_recording(self, file_name=None):
+        self._command('start')
+        self.recording = True
+
+    def stop_recording(self):
+        self._command('stop')
+        self.recording = False
+
+    def disconnect(self):
+        pass
+
+
+class FakeOBSClient(FakeDevice):
+    """Stands in for script.OBS, whose file name is set before the start or by it."""
+
+    def __init__(self, host='localhost', port=4455, password=None, fail=None):
+        super().__init__(latency=0.01, fail=fail)
+        self.file_name = None
+
+    def set_file_name(self, file_name):
+        self.file_name = file_name
+
+    def start_recording(self, file_name=None):
+        if file_name:
+            self.set_file_name(file_name)
+        super().start_recording()
+
+
+class FakeAria(FakeDevice):
+    def __init__(self, ip='', profile='profile28', fail=None):
+        super().__init__(latency=0.03, fail=fail)
+
+    def check_idle(self):
+        if self.recording:
+            raise RuntimeError('Glasses are already recording')
+
+    def start_recording(self, check=True):
+        if check:
+            self.check_idle()
+        super().start_recording()
+
+
+class SessionLogTest(unittest.TestCase):
+    def test_start_stop_released_together(self):
+        aria, obs = FakeAria(), FakeOBSClient()
+        log = SessionLog('P1_T1')
+        for command, calls in [('start', {'aria': aria.start_recording, 'obs': lambda: obs.start_recording('P1_T1')}),
+                               ('stop', {'aria': aria.stop_recording, 'obs': obs.stop_recording})]:
+            log.run(command, calls)
+            events = log.latest(command)
+            self.assertEqual(set(events), {'aria', 'obs'})
+
+            sent = [events[device]['sent_mono_ns'] for device in ['aria', 'obs']]
+            # Released by the barrier: sent within a few ms, not one device latency apart
+            self.assertLess(abs(sent[0] - sent[1]), 10e6)
+            for device, latency in [('aria', aria.latency), ('obs', obs.latency)]:
+                event = events[device]
+                self.assertIsNone(event['error'])
+                self.assertGreaterEqual(event['ack_mono_ns'] - event['sent_mono_ns'], latency * 1e9)
+                self.assertGreater(event['ack_wall_ns'], event['sent_wall_ns'])
+
+        self.assertFalse(aria.recording or obs.recording)
+        self.assertEqual(obs.file_name, 'P1_T1')
+
+    def test_error_is_recorded_and_raised(self):
+        aria, obs = FakeAria(fail='start'), FakeOBSClient()
+        log = SessionLog('P1_T1')
+        with self.assertRaises(RuntimeError) as raised:
+            log.run('start', {'aria': aria.start_recording, 'obs': obs.start_recording})
+
+        self.assertIn('aria failed to start', str(raised.exception))
+        events = log.latest('start')
+        self.assertIn('ConnectionError', events['aria']['error'])
+        # The other device still got its command and is recording
+        self.assertIsNone(events['obs']['error'])
+        self.assertTrue(obs.recording)
+
+
+class StationTest(unittest.TestCase):
+    def test_failed_start_stops_started_device(self):
+        station = Station({'name': 'station1', 'mock_fail': 'start'}, FakeAria, FakeOBSClient, mock=True)
+        station.connect()
+        # Both fakes get the failure, make only the Aria fail
+        station.obs.fail = None
+
+        with self.assertRaises(RuntimeError):
+            station.start('P1_T1')
+
+        self.assertFalse(station.aria.recording)
+        self.assertFalse(station.obs.recording)
+        self.assertEqual([command for command, _ in station.obs.calls], ['start', 'stop'])
+        self.assertEqual([command for command, _ in station.aria.calls], ['start'])
+        self.assertEqual(station.obs.file_name, 'P1_T1')
+
+    def test_recording_aria_is_rejected_before_start(self):
+        station = Station({'name': 'station1'}, FakeAria, FakeOBSClient, mock=True)
+        station.connect()
+        station.aria.recording = True
+
+        with self.assertRaises(RuntimeError):
+            station.start('P1_T1')
+
+        # Nothing was sent to either device
+        self.assertEqual(station.aria.calls, [])
+        self.assertEqual(station.obs.calls, [])
+
+
+class SidecarTest(unittest.TestCase):
+    def test_sync_vids_reads_sidecar(self):
+        from sync_vids import SIDECAR_FILE, sidecar_row
+
+        aria, obs = FakeAria(), FakeOBSClient()
+        log = SessionLog('P1_T1')
+        log.run('start', {'aria': aria.start_recording, 'obs': obs.start_recording})
+        time.sleep(0.5)
+        log.mark('beep')
+        time.sleep(1.0)
+        log.mark('beep')
+        log.run('stop', {'aria': aria.stop_recording, 'obs': obs.stop_recording})
+
+        with tempfile.TemporaryDirectory() as session_path:
+            log.save(os.path.join(session_path, SIDECAR_FILE))
+            with open(os.path.join(session_path, SIDECAR_FILE)) as f:
+                data = json.load(f)
+            self.assertEqual(data['name'], 'P1_T1')
+            self.assertEqual([e['command'] for e in data['events']], ['start', 'start', 'beep', 'beep', 'stop', 'stop'])
+
+            # No obs.mp4/aria.mp4 in the folder: both are read at the default 30 fps
+            start_webcam2, start_aria, start_screen, end_webcam2 = sidecar_row(session_path)
+
+        # Frame 0 is the middle of each start command, the beeps are 0.5 s and 1.5 s after the start
+        events = log.latest('start')
+        beeps = [e['mono_ns'] for e in data['events'] if e['command'] == 'beep']
+        for frame, device, beep in [(start_webcam2, 'obs', beeps[0]), (start_aria, 'aria', beeps[0]),
+                                    (end_webcam2, 'obs', beeps[1])]:
+            middle = (events[device]['sent_mono_ns'] + events[device]['ack_mono_ns']) / 2
+            self.assertEqual(frame, round((beep - middle) / 1e9 * 30))
+        self.assertEqual(start_screen, 0)
+        self.assertAlmostEqual(end_webcam2 - start_webcam2, 30, delta=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+Live touch detection on webcam2 while recording, so touch labels exist as soon as the recording stops.
+
+Frames come from the OBS virtual camera or the webcam itself (device index), or from a video file standing in for the
+camera. A capture thread keeps only the newest frame and a detector thread thresholds the green LED (same HSV bounds
+as data_processing/annotate_webcam.py) inside a fixed ROI. Frames the detector is too slow for are dropped instead of
+queued, so a decision is never more than about one frame behind the camera.
+
+Every touch start/end is appended to a CSV event log:
+    event,frame,wall_time,video_time,latency_ms,pixels
+    touch_start,1532,1737701234.512,51.067,4.1,87
+wall_time is the UNIX time the frame was captured, video_time the position in the file (stand-in source only).
+
+A full 3840x2160 OBS canvas (virtual camera) is cropped to the webcam2 quadrant before the ROI is applied, so the ROI
+is always given in webcam2 coordinates.
+
+Stand-alone test on a recording:
+python touch_monitor.py --source webcam2.mp4 --roi x1 y1 x2 y2 --log touch_events.csv
+"""
+import argparse
+import csv
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+LED_LOWER, LED_UPPER = np.array([45, 50, 100]), np.array([90, 255, 255])
+OBS_CANVAS = (2160, 3840)
+WEBCAM2_CROP = (slice(None, 1080), slice(1920, None))
+
+
+def open_source(source):
+    """cv2.VideoCapture of a device index ('0', '1', ...) or a video file. Return (cap, is_file)."""
+    is_file = not str(source).isdigit()
+    cap = cv2.VideoCapture(source if is_file else int(source))
+    if not cap.isOpened():
+        raise IOError(f'Cannot open capture source {source}')
+    return cap, is_file
+
+
+class TouchMonitor:
+    def __init__(self, source, roi, log_path, min_pixels=1, lower=LED_LOWER, upper=LED_UPPER, realtime=True):
+        self.cap, self.is_file = open_source(source)
+        # A file is played at its own frame rate to behave like a camera, unless realtime is False
+        self.frame_time = 1 / (self.cap.get(cv2.CAP_PROP_FPS) or 30.0) if self.is_file and realtime else 0
+        self.roi, self.log_path, self.min_pixels = roi, log_path, min_pixels
+        self.lower, self.upper = lower, upper
+
+        self.latest = None  # (frame number, wall time, video time, roi crop), newest frame only
+        self.cond = threading.Condition()
+        self.running = False
+        self.captured = self.processed = 0
+        self.latencies = []
+        self.threads = []
+
+    def start(self):
+        self.running = True
+        self.threads = [threading.Thread(target=self._capture, daemon=True),
+                        threading.Thread(target=self._detect, daemon=True)]
+        for t in self.threads:
+            t.start()
+        print(f'[INFO] Touch monitor started, logging to {self.log_path}')
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        for t in self.threads:
+            t.join()
+        self.cap.release()
+
+        dropped = self.captured - self.processed
+        latency = np.percentile(self.latencies, [50, 99]) if self.latencies else [0, 0]
+        print(f'[INFO] Touch monitor stopped: {self.processed} frames checked, {dropped} dropped, '
+              f'latency p50 {latency[0]:.1f}ms p99 {latency[1]:.1f}ms')
+
+    def wait(self):
+        """Block until a file source is exhausted."""
+        self.threads[0].join()
+        self.stop()
+
+    def _capture(self):
+        x1, y1, x2, y2 = self.roi
+        next_time = time.monotonic()
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            wall_time = time.time()
+            video_time = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000 if self.is_file else None
+
+            if frame.shape[:2] == OBS_CANVAS:
+                frame = frame[WEBCAM2_CROP]
+            # Copy the crop so the full frame buffer is released right away
+            crop = frame[y1:y2, x1:x2].copy()
+
+            with self.cond:
+                # Overwrite an unprocessed frame: the detector always works on the newest one
+                self.latest = (self.captured, wall_time, video_time, crop)
+                self.captured += 1
+                self.cond.notify()
+
+            if self.frame_time:
+                next_time += self.frame_time
+                time.sleep(max(0.0, next_time - time.monotonic()))
+
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def _detect(self):
+        touching = False
+        new_file = not os.path.exists(self.log_path)
+        with open(self.log_path, 'a', newline='') as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(['event', 'frame', 'wall_time', 'video_time', 'latency_ms', 'pixels'])
+
+            while True:
+                with self.cond:
+                    while self.latest is None and self.running:
+                        self.cond.wait()
+                    if self.latest is None:
+                        break
+                    frame_number, wall_time, video_time, crop = self.latest
+                    self.latest = None
+
+                mask = cv2.inRange(cv2.cvtColor(crop, cv2.COLOR_BGR2HSV), self.lower, self.upper)
+                pixels = cv2.countNonZero(mask)
+                latency = (time.time() - wall_time) * 1000
+                self.latencies.append(latency)
+                self.processed += 1
+
+                if (pixels >= self.min_pixels) != touching:
+                    touching = not touching
+                    writer.writerow(['touch_start' if touching else 'touch_end', frame_number, f'{wall_time:.3f}',
+                                     '' if video_time is None else f'{video_time:.3f}', f'{latency:.1f}', pixels])
+                    # Flushed per event so the log survives a crash of the recording script
+                    f.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Live touch detection from the webcam2 LED')
+    parser.add_argument('--source', type=str, required=True, help='Capture device index or a video file')
+    parser.add_argument('--roi', type=int, nargs=4, required=True, metavar=('X1', 'Y1', 'X2', 'Y2'),
+                        help='LED search region in webcam2 coordinates')
+    parser.add_argument('--log', type=str, default='touch_events.csv', help='Touch event log (CSV)')
+    parser.add_argument('--min-pixels', type=int, default=1, help='LED pixels needed to count as a touch')
+    parser.add_argument('--fast', action='store_true', help='Read a video file as fast as possible instead of at its fps')
+    args = parser.parse_args()
+
+    monitor = TouchMonitor(args.source, args.roi, args.log, args.min_pixels, realtime=not args.fast)
+    monitor.start()
+    try:
+        monitor.wait()
+    except KeyboardInterrupt:
+        monitor.stop()
@@ -0,0 +1,135 @@
+"""
+Huy Anh Nguyen
+CS PhD @Stony Brook University @University of Adelaide
+
+Created Feb 3, 2025
+---------------------
+Frame alignment table used by sync_vids.py: for every synced frame, the source frame number of each stream
+    frame,webcam1,webcam2,aria,screen
+    0,560,560,548,602
+    1,561,561,549,603 ...
+(screen is -1 when the session has no screen sync). Both writers (frames and video source) only follow this table.
+
+Two ways to build it from a manual_sync.csv row:
+    - index: every stream advances one frame per synced frame from its sync frame (assumes all streams run at exactly
+      the same constant frame rate, as before).
+    - timestamps: webcam2 is the reference. Every stream's frame times are made relative to its sync frame and each
+      webcam2 frame is matched to the stream frame with the nearest time (one vectorized np.searchsorted), so clock
+      drift and dropped or duplicated frames do not accumulate over long sessions. Frame times are the presentation
+      timestamps of the container (ffprobe, packet headers only, nothing is decoded), or the device capture times of
+      aria_timestamps.npy exported by convert_vrs.py --timestamps when present.
+"""
+import os
+import subprocess
+
+import numpy as np
+
+STREAMS = ['webcam1', 'webcam2', 'aria', 'screen']
+ARIA_TIMESTAMPS = 'aria_timestamps.npy'
+ALIGNMENT_FILE = 'alignment.csv'
+
+
+def container_timestamps(path, ffprobe='ffprobe'):
+    """Presentation time (seconds) of every video frame of path, in display order, without decoding."""
+    out = subprocess.run([ffprobe, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time',
+                          '-of', 'csv=p=0', path], capture_output=True, text=True, check=True).stdout
+    # Packets come in decode order, B-frames make it differ from display order
+    values = [v.strip(',') for v in out.split()]
+    return np.sort(np.array([v for v in values if v and v != 'N/A'], dtype=np.float64))
+
+
+def session_timestamps(session_path, ffprobe='ffprobe'):
+    """{'obs': seconds, 'aria': seconds} frame times of the session videos."""
+    times = {'obs': container_timestamps(os.path.join(session_path, 'obs.mp4'), ffprobe)}
+    aria_path = os.path.join(session_path, 'aria.mp4')
+    device_path = os.path.join(session_path, ARIA_TIMESTAMPS)
+    times['aria'] = container_timestamps(aria_path, ffprobe)
+    if os.path.exists(device_path):
+        device = np.load(device_path) / 1e9
+        # Only trusted when it describes the frames of aria.mp4
+        if len(device) == len(times['aria']):
+            times['aria'] = device
+        else:
+            print(f'[WARNING] {device_path} has {len(device)} frames, aria.mp4 {len(times["aria"])}. Using the '
+                  f'container timestamps')
+    return times
+
+
+def nearest(times, queries):
+    """Index of the element of sorted times closest to every query."""
+    idx = np.clip(np.searchsorted(times, queries), 1, len(times) - 1)
+    idx -= queries - times[idx - 1] < times[idx] - queries
+    return idx
+
+
+def sync_frames(row):
+    return map(int, row[3:7])
+
+
+def index_alignment(row, counts):
+    """Alignment with every stream advancing one frame per synced frame. counts: number of frames of every stream."""
+    start_webcam2, start_aria, start_screen, end_webcam2 = sync_frames(row)
+    n_webcam2 = counts['webcam2'] if end_webcam2 == 0 else min(counts['webcam2'], end_webcam2)
+    num_frames = min(n_webcam2 - start_webcam2, counts['aria'] - start_aria)
+    if start_screen != 0:
+        num_frames = min(num_frames, counts['screen'] - start_screen)
+
+    offsets = np.arange(max(0, num_frames))
+    return np.stack([start_webcam2 + offsets, start_webcam2 + offsets, start_aria + offsets,
+                     start_screen + offsets if start_screen != 0 else np.full_like(offsets, -1)], axis=1)
+
+
+def timestamp_alignment(row, times):
+    """Alignment matching every webcam2 frame with the nearest frame in time. times: {'obs', 'aria'} frame times."""
+    start_webcam2, start_aria, start_screen, end_webcam2 = sync_frames(row)
+    obs, aria = times['obs'], times['aria']
+    n_webcam2 = len(obs) if end_webcam2 == 0 else min(len(obs), end_webcam2)
+
+    webcam2 = np.arange(start_webcam2, n_webcam2)
+    reference = obs[webcam2] - obs[start_webcam2]
+    columns = {'aria': (aria - aria[start_aria], start_aria)}
+    if start_screen != 0:
+        # Screen is captured by OBS too but lags behind, its sync frame is its own zero
+        columns['screen'] = (obs - obs[start_screen], start_screen)
+
+    table = np.stack([webcam2, webcam2, np.zeros_like(webcam2), np.full_like(webcam2, -1)], axis=1)
+    num_frames = len(webcam2)
+    for name, (relative, start) in columns.items():
+        table[:, STREAMS.index(name)] = nearest(relative, reference)
+        # Stop where the stream ended: its last frame is more than half a frame away from the reference
+        half_frame = np.median(np.diff(relative[start:])) / 2 if len(relative) - start > 1 else 0
+        num_frames = min(num_frames, int(np.searchsorted(reference, relative[-1] + half_frame, side='right')))
+
+    return table[:num_frames]
+
+
+def report(table):
+    """Print how far the timestamp alignment moved from the index alignment."""
+    if not len(table):
+        return
+    drift = table[:, 2] - table[0, 2] - np.arange(len(table))
+    print(f'[INFO] Aria drift over the session: {drift[-1]} frames, '
+          f'{np.count_nonzero(np.diff(table[:, 2]) == 0)} duplicated, '
+          f'{np.count_nonzero(np.diff(table[:, 2]) > 1)} skipped')
+
+
+def save_alignment(path, table):
+    header = 'frame,' + ','.join(STREAMS)
+    np.savetxt(path, np.column_stack([np.arange(len(table)), table]), fmt='%d', delimiter=',', header=header,
+               comments='')
+
+
+def load_alignment(path):
+    return np.loadtxt(path, dtype=np.int64, delimiter=',', skiprows=1, ndmin=2)[:, 1:]
+
+
+def build_alignment(row, session_path, counts, align='index', ffprobe='ffprobe'):
+    """Alignment table of a session, cut where a stream runs out of frames (counts: frames available per stream)."""
+    if align == 'timestamps':
+        table = timestamp_alignment(row, session_timestamps(session_path, ffprobe))
+        report(table)
+    else:
+        table = index_alignment(row, counts)
+
+    available = np.all([(table[:, i] < counts[name]) | (table[:, i] < 0) for i, name in enumerate(STREAMS)], axis=0)
+    return table[:len(table) if available.all() else int(np.argmin(available))]
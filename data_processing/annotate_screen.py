@@ -6,29 +6,87 @@ Created Jan 2, 2025
 ---------------------
 When pen touches the repaper, the Repaper Studio crosshair will turn magenta. This script will automatically annotate the touch frames
 The magneta crosshair is unique so no need to select the region of interest.
+
+By default the synced rgb_frames/screen JPEGs are used. With --source video the synced videos/screen.mp4 is decoded
+directly instead, so screen JPEGs never need to be materialized. --video annotates a single video, e.g. a raw obs.mp4
+(the screen quadrant is cropped automatically), and writes screen_touch_annotation.npz/.json next to it.
+Use --scale 2 or 4 to threshold downscaled frames (the crosshair stays detectable). Each frame is thresholded in
+horizontal strips.
+rgb_frames/screen.frames frame stores (see frame_store.py) are read the same way as JPEG folders.
+The number of magenta pixels of every frame is kept in screen_touch_scores.npy and the labels are derived from it with
+the filter arguments (--on/--off/--min-frames/--median, see touch_scores.py), which touch_scores.py can change later
+without decoding the frames again.
 """
 
 
 import argparse
-import json
 from pathlib import Path
 
 import cv2
 import numpy as np
 from tqdm import tqdm
 
+from frame_store import STORE_SUFFIX, open_frames
+from manifest import Manifest, add_manifest_args
+from touch_annotation import annotation_exists, annotation_outputs, save_annotation
+from touch_scores import add_filter_args, clean_labels, filter_params, save_scores, scores_path
+from video_to_frames import OBS_CROPS
+
 parser = argparse.ArgumentParser(description='Annotate touch frames based on green LED detection')
 # parser.add_argument('-i', '--input', type=str, required=True, help='Path to the collected data folder')
 parser.add_argument('-i', '--input', type=str, default='/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Data')
 parser.add_argument('-d', '--debug', action='store_true', help='Debug mode, will create a manual verification folder')
+parser.add_argument('--no-json', action='store_true', help='Only write the compact .npz annotation (see touch_annotation.py)')
+add_manifest_args(parser)
+parser.add_argument('-s', '--source', type=str, default='frames', choices=['frames', 'video'],
+                    help='Read rgb_frames/screen JPEGs or decode videos/screen.mp4 directly')
+parser.add_argument('-v', '--video', type=str, default=None, help='Annotate a single screen.mp4 or obs.mp4')
+parser.add_argument('--scale', type=int, default=1, help='Downscale factor applied before thresholding')
+parser.add_argument('--strips', type=int, default=4, help='Number of horizontal strips thresholded one after the other')
+add_filter_args(parser)
 
 args = parser.parse_args()
 args.input = Path(args.input)
+filter_args = filter_params(args)
 
 lower, upper = np.array([150, 100, 100]), np.array([165, 255, 255])
 
+def read_video(video_path):
+    """Yield (frame_name, frame) for every frame of a video, cropping the screen quadrant of a full OBS canvas."""
+    cap = cv2.VideoCapture(str(video_path))
+    frame_count = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        if frame.shape[:2] == (2160, 3840):
+            frame = frame[OBS_CROPS['screen']]
+
+        yield f'{frame_count:08d}.jpg', frame
+        frame_count += 1
+
+    cap.release()
+
+def read_frames(all_frames):
+    for i, frame_name in enumerate(all_frames.names):
+        yield frame_name, all_frames.read(i)
+
+def count_color(img, lower, upper, strips=4):
+    """Number of in-range pixels of img, thresholded strip by strip so the HSV copy stays small."""
+    return sum(cv2.countNonZero(cv2.inRange(cv2.cvtColor(strip, cv2.COLOR_BGR2HSV), lower, upper))
+               for strip in np.array_split(img, strips))
+
 # Main loop to process all splits
-all_videos = sorted(list(args.input.glob('*/*/rgb_frames/screen')))
+if args.video:
+    all_videos = [Path(args.video)]
+elif args.source == 'video':
+    all_videos = sorted(list(args.input.glob('*/*/videos/screen.mp4')))
+else:
+    # A session has either a JPEG folder or a frame store, open_frames() picks the store when both exist
+    all_videos = sorted({vid.with_suffix('') if vid.suffix == STORE_SUFFIX else vid
+                         for vid in args.input.glob('*/*/rgb_frames/screen*')
+                         if vid.name in ('screen', f'screen{STORE_SUFFIX}')})
 print(f'[INFO] Total {len(all_videos)} videos...')
 
 for vid in sorted(all_videos):
@@ -36,53 +94,76 @@ for vid in sorted(all_videos):
         continue
 
     """Main function to process frames and select regions of interest."""
+    # rgb_frames/screen and videos/screen.mp4 are both one level below the session folder
+    session_dir = vid.parent if args.video else vid.parents[1]
     # anno_path = os.path.join(args.input, vid, 'annotation.json')
-    anno_path = vid.parents[1].joinpath('screen_touch_annotation.json')
-    all_frames = sorted(vid.glob('*.jpg'))
-
-    if anno_path.exists():
-        print(f"[INFO] {anno_path} already exists. Skip this video.")
+    stage = 'annotate_screen'
+    params = {'hsv': [lower, upper], 'scale': args.scale, **filter_args}
+    outputs = annotation_outputs(session_dir, 'screen', not args.no_json) + [scores_path(session_dir, 'screen')]
+    manifest = Manifest(session_dir, args.hash)
+    # The frame store is the input when rgb_frames/screen.frames was read instead of the JPEG folder
+    all_frames = None if vid.suffix == '.mp4' else open_frames(vid)
+    inputs = [vid if all_frames is None else all_frames.path]
+    # Annotations made before manifests (or before scores were kept) are kept as they are
+    if not args.force and (manifest.is_fresh(stage, inputs, params, outputs)
+                           or manifest.is_fresh(stage, inputs, params, outputs[:-1])
+                           or (stage not in manifest.stages and annotation_exists(session_dir, 'screen'))):
+        print(f"[INFO] {outputs[0]} is up to date. Skip this video.")
         continue
+    manifest.start(stage, inputs, params)
 
     print('=' * 80)
     print(f"[INFO] Processing {Path(*vid.parts[-4:])} ...")
 
-    res = {'bbox': None, 'annotations': {}}
-    if len(all_frames) == 0:
+    if all_frames is None:
+        cap = cv2.VideoCapture(str(vid))
+        num_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        frames = read_video(vid)
+    else:
+        num_frames = len(all_frames)
+        frames = read_frames(all_frames)
+
+    if num_frames == 0:
             print("No screen frames found. Skip this video.")
             continue
 
     if args.debug:
         # Create a temporary separation folder to manually verify the touch annotation
         print(f"[INFO] Debug mode. Creating manual verification folder ...")
-        pos_dir = vid.parents[1].joinpath('screen_manual_verification', 'touch')
+        pos_dir = session_dir.joinpath('screen_manual_verification', 'touch')
         pos_dir.mkdir(parents=True, exist_ok=True)
 
-        neg_dir = vid.parents[1].joinpath('screen_manual_verification', 'non_touch')
+        neg_dir = session_dir.joinpath('screen_manual_verification', 'non_touch')
         neg_dir.mkdir(parents=True, exist_ok=True)
 
     # Detect touch or non-touch based on the green LED in the average bounding box
-    pos_cnt = 0
-    neg_cnt = 0
-    for frame_path in tqdm(all_frames):
-        img = cv2.imread(frame_path)
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        mask = cv2.inRange(hsv, lower, upper)
-
-        if np.count_nonzero(mask) > 0:
-            res['annotations'][frame_path.name] = 1
-            pos_cnt += 1
-            if args.debug:
-                cv2.imwrite(pos_dir.joinpath(frame_path.name), img)
-                cv2.imwrite(pos_dir.joinpath(frame_path.name.replace('.jpg', '_mask.jpg')), mask)
-
+    scores = []
+    for frame_name, img in tqdm(frames, total=num_frames):
+        if args.scale > 1:
+            img = cv2.resize(img, (img.shape[1] // args.scale, img.shape[0] // args.scale), interpolation=cv2.INTER_AREA)
+
+        if args.debug:
+            mask = cv2.inRange(cv2.cvtColor(img, cv2.COLOR_BGR2HSV), lower, upper)
+            count = np.count_nonzero(mask)
         else:
-            res['annotations'][frame_path.name] = 0
-            neg_cnt += 1
-            if args.debug:
-                cv2.imwrite(neg_dir.joinpath(frame_path.name), img)
-
-    print(f'{vid} done. Touch: {pos_cnt} Non-touch: {neg_cnt}')
-
-    with open(anno_path, 'w') as f:
-        json.dump(res, f, indent=4)
+            count = count_color(img, lower, upper, args.strips)
+        # In full resolution pixels, so the thresholds do not depend on --scale
+        scores.append(count * args.scale ** 2)
+
+        # Unfiltered, only for the verification folder
+        if args.debug:
+            if scores[-1] >= args.on:
+                cv2.imwrite(pos_dir.joinpath(frame_name), img)
+                cv2.imwrite(pos_dir.joinpath(frame_name.replace('.jpg', '_mask.jpg')), mask)
+            else:
+                cv2.imwrite(neg_dir.joinpath(frame_name), img)
+
+    scores = np.array(scores, dtype=np.float32)
+    labels = clean_labels(scores, args.on, args.off, args.min_frames, args.median)
+    pos_cnt = int(np.count_nonzero(labels))
+    print(f'{vid} done. Touch: {pos_cnt} Non-touch: {len(labels) - pos_cnt}')
+
+    save_scores(session_dir, 'screen', scores)
+    save_annotation(session_dir, 'screen', labels, export_json=not args.no_json)
+    manifest.finish(stage, inputs, params, outputs)
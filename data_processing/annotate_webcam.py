@@ -11,26 +11,66 @@ For each video, 3 frames will be randomly selected for bounding box selection. T
 to detect touch frames.
 
 Note: the script only search for webcam2 streams as aria glasses and webcam1 green color is not that accurate.
+
+Frames are decoded by a thread pool (-w) and thresholded in batches (-b): the ROI crops of a batch are stacked into one
+array so HSV conversion, inRange and pixel counting run once per batch. With --reduce, large search boxes are decoded
+at 1/2, 1/4 or 1/8 resolution straight from the JPEG (the LED stays at least --min-roi pixels wide).
+rgb_frames/<stream>.frames frame stores (see frame_store.py) are read the same way as JPEG folders.
+
+With --roi auto no window is opened: --roi-samples frames spread over the video are decoded at reduced resolution and
+the frequency at which every pixel is in the LED color range is accumulated. Pixels that are almost always in range are
+static green objects, not the LED, and pixels in range in only a couple of samples are noise, both are ignored. The
+search box is the bounding box (plus --roi-margin) of the cluster holding most of the remaining activations. When that
+cluster holds less than --roi-confidence of them (no touch in the samples, several lit spots), the interactive
+selection is used as a fallback, or the video is skipped with --no-fallback (headless runs). The box is recorded in the
+annotation as before, the manifest info also records how it was chosen. Annotations made with hand-drawn boxes stay
+fresh, use --force to redo them automatically.
+
+The number of in-range pixels of every frame is kept in <stream>_touch_scores.npy and the labels are derived from it
+with the filter arguments (--on/--off/--min-frames/--median, see touch_scores.py), which touch_scores.py can change
+later without decoding the frames again.
 """
 
 
 import argparse
-import json
+import math
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import cv2
 import numpy as np
 from tqdm import tqdm
 
+from frame_store import STORE_SUFFIX, open_frames
+from manifest import Manifest, add_manifest_args
+from touch_annotation import annotation_exists, annotation_outputs, save_annotation
+from touch_scores import add_filter_args, clean_labels, filter_params, save_scores, scores_path
+
 parser = argparse.ArgumentParser(description='Annotate touch frames based on green LED detection')
 # parser.add_argument('-i', '--input', type=str, required=True, help='Path to the collected data folder')
 parser.add_argument('-i', '--input', type=str, default='/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Data')
 parser.add_argument('-s', '--stream', type=str, default='webcam2', help='Stream to process (webcam1, webcam2, aria)')
 parser.add_argument('-d', '--debug', action='store_true', help='Debug mode, will create a manual verification folder')
+parser.add_argument('--no-json', action='store_true', help='Only write the compact .npz annotation (see touch_annotation.py)')
+add_manifest_args(parser)
+parser.add_argument('-w', '--workers', type=int, default=8, help='Number of JPEG decoding threads')
+parser.add_argument('-b', '--batch', type=int, default=256, help='Number of frames thresholded together')
+parser.add_argument('--reduce', action='store_true', help='Decode large search boxes at reduced JPEG resolution')
+parser.add_argument('--min-roi', type=int, default=32, help='Smallest side of the search box after reduced decoding')
+parser.add_argument('--roi', type=str, default='manual', choices=['manual', 'auto'],
+                    help='Draw the search box on 3 frames (manual) or find it from the LED activations (auto)')
+parser.add_argument('--roi-samples', type=int, default=300, help='Number of frames sampled to find the search box')
+parser.add_argument('--roi-margin', type=int, default=16, help='Pixels added around the automatic search box')
+parser.add_argument('--roi-confidence', type=float, default=0.6,
+                    help='Smallest share of the LED activations in the automatic box, below it the box is drawn by hand')
+parser.add_argument('--no-fallback', action='store_true',
+                    help='Skip the video instead of opening a window when the automatic box is not confident')
+add_filter_args(parser)
 
 args = parser.parse_args()
 
 args.input = Path(args.input)
+filter_args = filter_params(args)
 
 COLOR_BOUND = {'webcam1': [None,
                            None],
@@ -61,10 +101,8 @@ def draw_bbox(event, x, y, flags, param):
         drawing[0] = False
         end_point[0], end_point[1] = x, y
 
-def select_roi(image_path):
-    """Open an image and allow the user to draw a bounding box. Return the coordinates."""
-    # Load the image
-    img = cv2.imread(image_path)
+def select_roi(img):
+    """Show an image and allow the user to draw a bounding box. Return the coordinates."""
     temp_img = img.copy()
 
     # Initialize variables for start/end points and drawing state
@@ -106,8 +144,111 @@ def union_bboxes(bboxes):
     y2_union = max([bbox[3] for bbox in bboxes])  # Largest y2
     return (x1_union, y1_union, x2_union, y2_union)
 
+REDUCED_READ = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4,
+                8: cv2.IMREAD_REDUCED_COLOR_8}
+
+def decode_scale(bbox, min_roi):
+    """Largest JPEG reduction factor that keeps the smallest side of bbox at least min_roi pixels."""
+    side = min(bbox[2] - bbox[0], bbox[3] - bbox[1])
+    return max([s for s in REDUCED_READ if side // s >= min_roi], default=1)
+
+def read_roi(frames, i, bbox, scale=1):
+    """Decode frame i (at 1/scale resolution) and return the crop of bbox given in full resolution coordinates."""
+    img = frames.read(i, REDUCED_READ[scale])
+    x1, y1 = bbox[0] // scale, bbox[1] // scale
+    x2, y2 = math.ceil(bbox[2] / scale), math.ceil(bbox[3] / scale)
+    return img[y1:y2, x1:x2]
+
+def detect_batches(frames, bbox, lower, upper, workers=8, batch_size=256, scale=1):
+    """Yield (crops, masks, counts) for consecutive batches of frames (see frame_store.open_frames), counts being the
+    in-range pixels per frame."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # cv2.imread releases the GIL. Keep one batch decoding ahead while the current one is thresholded
+        def read(start):
+            return pool.map(lambda i: read_roi(frames, i, bbox, scale), range(start, min(start + batch_size, len(frames))))
+
+        pending = read(0)
+        for start in range(0, len(frames), batch_size):
+            crops = np.stack(list(pending))
+            if start + batch_size < len(frames):
+                pending = read(start + batch_size)
+
+            n, h, w = crops.shape[:3]
+            # One cvtColor/inRange call over the whole batch, stacked vertically as a single image
+            hsv = cv2.cvtColor(crops.reshape(n * h, w, 3), cv2.COLOR_BGR2HSV)
+            masks = cv2.inRange(hsv, lower, upper).reshape(n, h, w)
+            yield crops, masks, np.count_nonzero(masks, axis=(1, 2))
+
+ROI_SCALE = 2  # sampled frames are decoded at 1/ROI_SCALE resolution
+STATIC_RATIO = 0.9  # pixels in range in more than this share of the samples are not the LED
+MIN_HITS = 3  # pixels in range in fewer samples are noise
+
+def auto_roi(frames, lower, upper, num_samples=300, margin=16, workers=8, batch_size=64):
+    """Search box from where the LED lights up in sparsely sampled frames. Return (bbox, confidence), bbox is None when
+    nothing lit up."""
+    samples = np.unique(np.linspace(0, len(frames) - 1, min(num_samples, len(frames))).astype(int))
+    frequency = None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(samples), batch_size):
+            imgs = np.stack(list(pool.map(lambda i: frames.read(i, REDUCED_READ[ROI_SCALE]),
+                                          samples[start:start + batch_size])))
+            n, h, w = imgs.shape[:3]
+            hsv = cv2.cvtColor(imgs.reshape(n * h, w, 3), cv2.COLOR_BGR2HSV)
+            hits = np.count_nonzero(cv2.inRange(hsv, lower, upper).reshape(n, h, w), axis=0)
+            frequency = hits if frequency is None else frequency + hits
+
+    frequency = np.where(frequency >= MIN_HITS, frequency / len(samples), 0)
+    frequency[frequency > STATIC_RATIO] = 0
+    if not frequency.any():
+        return None, 0.0
+
+    # Pixels lit at least a quarter as often as the most active one, gaps of a few pixels closed to one cluster
+    active = (frequency >= frequency.max() / 4).astype(np.uint8)
+    active = cv2.dilate(active, np.ones((5, 5), np.uint8))
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(active)
+    mass = np.bincount(labels.ravel(), weights=frequency.ravel(), minlength=num_labels)
+    mass[0] = 0
+    best = int(np.argmax(mass))
+    confidence = float(mass[best] / frequency.sum())
+
+    x, y, bw, bh = stats[best, :4]
+    height, width = frequency.shape[0] * ROI_SCALE, frequency.shape[1] * ROI_SCALE
+    bbox = (int(max(0, x * ROI_SCALE - margin)), int(max(0, y * ROI_SCALE - margin)),
+            int(min(width, (x + bw) * ROI_SCALE + margin)), int(min(height, (y + bh) * ROI_SCALE + margin)))
+    return bbox, confidence
+
+def manual_roi(frames):
+    """Union of the boxes drawn on 3 random frames far apart, None if a selection was skipped."""
+    # Calculate the indices for dividing into thirds
+    third_1_end = len(frames) // 3
+    third_2_end = 2 * len(frames) // 3
+
+    # Randomly select 3 frames far apart
+    sample_frames = [np.random.randint(0, third_1_end),
+                     np.random.randint(third_1_end, third_2_end),
+                     np.random.randint(third_2_end, len(frames))]
+
+    bboxes = []
+
+    # Open window for each frame and get bounding box coordinates
+    for i in sample_frames:
+        # print(f"Select ROI for {frame}")
+        bbox = select_roi(frames.read(i))
+        if bbox:
+            bboxes.append(bbox)
+
+        print(f"ROI selected for {frames.names[i]}: {bbox}")
+
+    if len(bboxes) < 3:
+        return None
+    # Calculate the average bounding box
+    return union_bboxes(bboxes)
+
 # Main loop to process all splits
-all_videos = sorted(list(args.input.glob(f'*/*/rgb_frames/{args.stream}')))
+# A session has either a JPEG folder or a frame store, open_frames() picks the store when both exist
+all_videos = sorted({vid.with_suffix('') if vid.suffix == STORE_SUFFIX else vid
+                     for vid in args.input.glob(f'*/*/rgb_frames/{args.stream}*')
+                     if vid.name in (args.stream, f'{args.stream}{STORE_SUFFIX}')})
 print(f'[INFO] Total {len(all_videos)} videos...')
 
 for vid in sorted(all_videos):
@@ -115,17 +256,24 @@ for vid in sorted(all_videos):
         continue
 
     """Main function to process frames and select regions of interest."""
-    anno_path = vid.parents[1].joinpath(f'{args.stream}_touch_annotation.json')
-    all_frames = sorted(vid.glob('*.jpg'))
-
-    if anno_path.exists():
-        print(f"[INFO] {anno_path} already exists. Skip this video.")
+    all_frames = open_frames(vid)
+
+    stage = f'annotate_{args.stream}'
+    params = {'hsv': COLOR_BOUND[args.stream], 'reduce': args.reduce, 'min_roi': args.min_roi, **filter_args}
+    outputs = (annotation_outputs(vid.parents[1], args.stream, not args.no_json)
+               + [scores_path(vid.parents[1], args.stream)])
+    manifest = Manifest(vid.parents[1], args.hash)
+    # Annotations made before manifests (or before scores were kept) are kept as they are
+    if not args.force and (manifest.is_fresh(stage, [all_frames.path], params, outputs)
+                           or manifest.is_fresh(stage, [all_frames.path], params, outputs[:-1])
+                           or (stage not in manifest.stages and annotation_exists(vid.parents[1], args.stream))):
+        print(f"[INFO] {outputs[0]} is up to date. Skip this video.")
         continue
+    manifest.start(stage, [all_frames.path], params)
 
     print('=' * 80)
     print(f"[INFO] Processing {Path(*vid.parts[-4:])} ...")
 
-    res = {'bbox': None, 'annotations': {}}
     if len(all_frames) < 3:
             print(f"Not enough frames to select from. Num frames: {len(all_frames)}")
             continue
@@ -140,62 +288,63 @@ for vid in sorted(all_videos):
 
 
 
-    # Calculate the indices for dividing into thirds
-    third_1_end = len(all_frames) // 3
-    third_2_end = 2 * len(all_frames) // 3
-
-    # Randomly select 3 frames far apart
-    sample_frames = [np.random.choice(all_frames[:third_1_end]),
-                        np.random.choice(all_frames[third_1_end:third_2_end]),
-                        np.random.choice(all_frames[third_2_end:])]
-
-    bboxes = []
-
-    # Open window for each frame and get bounding box coordinates
-    for frame in sample_frames:
-        # print(f"Select ROI for {frame}")
-        bbox = select_roi(frame)
-        if bbox:
-            bboxes.append(bbox)
-
-        print(f"ROI selected for {frame.name}: {bbox}")
-
-    if len(bboxes) == 3:
-        # Calculate the average bounding box
-        u_bbox = union_bboxes(bboxes)
-        res['bbox'] = u_bbox
-        print(f"Search region bounding box: {u_bbox}")
-
-    else:
-        print("Bounding box selection was incomplete. Skip this video.")
-        continue
+    roi_info = {'roi': 'manual'}
+    u_bbox = None
+    if args.roi == 'auto':
+        u_bbox, confidence = auto_roi(all_frames, lower_green, upper_green, args.roi_samples, args.roi_margin,
+                                      args.workers)
+        print(f"[INFO] Automatic search box {u_bbox}, confidence {confidence:.2f}")
+        roi_info = {'roi': 'auto', 'confidence': round(confidence, 3)}
+        if u_bbox is None or confidence < args.roi_confidence:
+            u_bbox = None
+            if args.no_fallback:
+                print("[WARNING] Automatic search box is not confident enough. Skip this video.")
+                continue
+            print("[WARNING] Automatic search box is not confident enough, select it by hand")
+            roi_info['roi'] = 'fallback'
+
+    if u_bbox is None:
+        u_bbox = manual_roi(all_frames)
+        if u_bbox is None:
+            print("Bounding box selection was incomplete. Skip this video.")
+            continue
+    print(f"Search region bounding box: {u_bbox}")
 
     # Detect touch or non-touch based on the green LED in the average bounding box
-    pos_cnt = 0
-    neg_cnt = 0
-    for frame_path in tqdm(all_frames):
-        img = cv2.imread(frame_path)
-        img = img[u_bbox[1]:u_bbox[3], u_bbox[0]:u_bbox[2]]
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        mask = cv2.inRange(hsv, lower_green, upper_green)
-
-        if np.count_nonzero(mask) > 0:
-            res['annotations'][frame_path.name] = 1
-            pos_cnt += 1
-            if args.debug:
-                cv2.imwrite(pos_dir.joinpath(frame_path.name), img)
-                cv2.imwrite(pos_dir.joinpath(frame_path.name.replace('.jpg', '_mask.jpg')), mask)
-
-        else:
-            res['annotations'][frame_path.name] = 0
-            neg_cnt += 1
-            if args.debug:
-                cv2.imwrite(neg_dir.joinpath(frame_path.name), img)
-
-    print(f'{vid} done. Touch: {pos_cnt} Non-touch: {neg_cnt}')
-
-    with open(anno_path, 'w') as f:
-        json.dump(res, f, indent=4)
+    scale = decode_scale(u_bbox, args.min_roi) if args.reduce else 1
+    if scale > 1:
+        print(f"[INFO] Decoding frames at 1/{scale} resolution")
+
+    frame_names = all_frames.names
+    scores = []
+    progress = tqdm(total=len(all_frames))
+    for start, (crops, masks, counts) in zip(range(0, len(all_frames), args.batch),
+                                             detect_batches(all_frames, u_bbox, lower_green, upper_green,
+                                                            args.workers, args.batch, scale)):
+        # In full resolution pixels, so the thresholds do not depend on --reduce
+        scores.append(counts.astype(np.float32) * scale ** 2)
+        # Unfiltered, only for the verification folder
+        touch = scores[-1] >= args.on
+
+        if args.debug:
+            for frame_name, img, mask, is_touch in zip(frame_names[start:], crops, masks, touch):
+                if is_touch:
+                    cv2.imwrite(pos_dir.joinpath(frame_name), img)
+                    cv2.imwrite(pos_dir.joinpath(frame_name.replace('.jpg', '_mask.jpg')), mask)
+                else:
+                    cv2.imwrite(neg_dir.joinpath(frame_name), img)
+
+        progress.update(len(touch))
+    progress.close()
+
+    scores = np.concatenate(scores)
+    labels = clean_labels(scores, args.on, args.off, args.min_frames, args.median)
+    pos_cnt = int(np.count_nonzero(labels))
+    print(f'{vid} done. Touch: {pos_cnt} Non-touch: {len(labels) - pos_cnt}')
+
+    save_scores(vid.parents[1], args.stream, scores)
+    save_annotation(vid.parents[1], args.stream, labels, u_bbox, export_json=not args.no_json)
+    manifest.finish(stage, [all_frames.path], params, outputs, info={'bbox': u_bbox, **roi_info})
 
 
 
@@ -0,0 +1,229 @@
+"""
+Huy Anh Nguyen
+CS PhD @Stony Brook University @University of Adelaide
+
+Created Jan 24, 2025
+---------------------
+Estimate the webcam2 <-> aria sync of manual_sync.csv from the beeps played by data_collection/script.py at the start
+and at the end of every recording.
+
+For each Day/P/T session:
+    1. Audio of obs.mp4 and aria.mp4 is decoded by ffmpeg to mono float32 and streamed in chunks, so an hour of audio is
+       never fully in memory. Only the first/last --search seconds are read.
+    2. The beep onset in OBS is the first point reaching half of the loudest short-time energy. A short template
+       around it is cut out.
+    3. The template is slid over the aria audio with chunked (overlap-save) FFT normalized cross-correlation, the best
+       match gives the aria beep time.
+    4. Times are converted to frame numbers with the fps of each video:
+       Start_Webcam2_Frame/Start_Aria_Frame from the start beep, End_Webcam2_Frame from the stop beep of OBS.
+       The stop beep is also matched in aria to report the drift between both clocks.
+
+Usage:
+python auto_sync.py -i [path_to_raw_folder] -c [csv_sync_file]            <- compare estimates with the CSV
+python auto_sync.py -i [path_to_raw_folder] -c [csv_sync_file] --write    <- update/add the CSV rows
+"""
+import argparse
+import csv
+import os
+import subprocess
+from glob import glob
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+parser = argparse.ArgumentParser(description='Estimate sync frames from the start/stop beeps')
+parser.add_argument('-i', '--input', type=str, default='/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Raw',
+                    help='Path to the collected raw data folder (Day/P/T/obs.mp4, aria.mp4)')
+parser.add_argument('-c', '--csv', type=str, default='/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Raw/manual_sync.csv',
+                    help='Path to the CSV file')
+parser.add_argument('--write', action='store_true', help='Write the estimates to the CSV instead of only comparing')
+parser.add_argument('--search', type=float, default=60.0, help='Seconds searched for the beep at each end')
+parser.add_argument('--rate', type=int, default=16000, help='Audio sample rate used for matching')
+parser.add_argument('--min-score', type=float, default=0.3, help='Minimum normalized correlation to trust a match')
+parser.add_argument('--tolerance', type=int, default=2, help='Frames of difference reported as a mismatch')
+parser.add_argument('--ffmpeg', type=str, default='ffmpeg', help='Path to the ffmpeg executable')
+
+CHUNK_SECONDS = 10
+TEMPLATE_PRE, TEMPLATE_POST = 0.1, 0.5  # seconds of audio kept before/after the beep onset
+
+
+def read_audio(path, rate, start=0.0, duration=None, ffmpeg='ffmpeg'):
+    """Yield mono float32 chunks of the audio track of path, starting at start seconds."""
+    command = [ffmpeg, '-loglevel', 'error', '-ss', f'{start:.3f}']
+    if duration is not None:
+        command += ['-t', f'{duration:.3f}']
+    command += ['-i', path, '-vn', '-ac', '1', '-ar', str(rate), '-f', 'f32le', '-']
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    chunk_bytes = CHUNK_SECONDS * rate * 4
+    try:
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype=np.float32)
+    finally:
+        process.stdout.close()
+        if process.wait() != 0:
+            raise RuntimeError(f'ffmpeg could not read the audio of {path}')
+
+
+def video_info(path):
+    """(fps, duration in seconds) from the container."""
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    n_frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    cap.release()
+    # Unreadable video: 0 or -1 depending on the OpenCV version
+    fps = fps if fps > 0 else 30.0
+    return fps, max(0.0, n_frames) / fps
+
+
+def find_onset(audio, rate, window=0.01):
+    """Sample index where the short-time energy first reaches half of its maximum."""
+    n = max(1, int(window * rate))
+    csum = np.concatenate([[0], np.cumsum(audio.astype(np.float64) ** 2)])
+    energy = (csum[n:] - csum[:-n]) / n
+    return int(np.argmax(energy >= energy.max() / 2))
+
+
+def correlate_stream(chunks, template):
+    """Slide template over a stream of audio chunks (overlap-save FFT). Return (best start sample, normalized score)."""
+    template = template - template.mean()
+    m = len(template)
+    nfft = 1 << int(np.ceil(np.log2(4 * m)))
+    step = nfft - m + 1
+    # Correlation is a convolution with the reversed template
+    spectrum = np.fft.rfft(template[::-1], nfft)
+    t_norm = np.linalg.norm(template) + 1e-12
+
+    best_start, best_score = -1, 0.0
+
+    def scan(block, offset, n_starts):
+        nonlocal best_start, best_score
+        corr = np.fft.irfft(np.fft.rfft(block, nfft) * spectrum, nfft)[m - 1:m - 1 + n_starts]
+        csum = np.concatenate([[0], np.cumsum(block.astype(np.float64) ** 2)])
+        energy = csum[m:m + n_starts] - csum[:n_starts]
+        score = corr / (t_norm * np.sqrt(np.maximum(energy, 1e-12)))
+        i = int(np.argmax(score))
+        if score[i] > best_score:
+            best_start, best_score = offset + i, float(score[i])
+
+    buf = np.zeros(0, dtype=np.float32)
+    offset = 0  # absolute sample index of buf[0]
+    for chunk in chunks:
+        buf = np.concatenate([buf, chunk])
+        while len(buf) >= nfft:
+            scan(buf[:nfft], offset, step)
+            buf = buf[step:]
+            offset += step
+
+    if len(buf) >= m:
+        scan(np.pad(buf, (0, nfft - len(buf))), offset, len(buf) - m + 1)
+
+    return best_start, best_score
+
+
+def match_beep(obs_path, aria_path, obs_start, aria_start, args):
+    """Find the beep in the OBS window starting at obs_start and the matching point in the aria window.
+    Return (obs_time, aria_time, score) in seconds from the beginning of each file."""
+    obs_audio = np.concatenate(list(read_audio(obs_path, args.rate, obs_start, args.search, args.ffmpeg)))
+    onset = find_onset(obs_audio, args.rate)
+    t0 = max(0, onset - int(TEMPLATE_PRE * args.rate))
+    template = obs_audio[t0:onset + int(TEMPLATE_POST * args.rate)]
+
+    aria_chunks = read_audio(aria_path, args.rate, aria_start, args.search, args.ffmpeg)
+    match, score = correlate_stream(aria_chunks, template)
+
+    obs_time = obs_start + onset / args.rate
+    aria_time = aria_start + (match + onset - t0) / args.rate
+    return obs_time, aria_time, score
+
+
+def estimate_session(session_path, args):
+    """Return (start_webcam2, start_aria, end_webcam2) frame numbers, or raise if the beeps cannot be trusted."""
+    obs_path = os.path.join(session_path, 'obs.mp4')
+    aria_path = os.path.join(session_path, 'aria.mp4')
+    obs_fps, obs_duration = video_info(obs_path)
+    aria_fps, aria_duration = video_info(aria_path)
+
+    obs_t, aria_t, score = match_beep(obs_path, aria_path, 0.0, 0.0, args)
+    print(f'[INFO] Start beep: obs {obs_t:.3f}s aria {aria_t:.3f}s (score {score:.2f})')
+    if score < args.min_score:
+        raise ValueError(f'Start beep match is not reliable (score {score:.2f} < {args.min_score})')
+
+    start_webcam2 = round(obs_t * obs_fps)
+    start_aria = round(aria_t * aria_fps)
+
+    end_webcam2 = 0
+    # The tail window starts after the start beep, sessions shorter than --search would find it again
+    obs_tail = max(obs_t + TEMPLATE_POST, obs_duration - args.search)
+    aria_tail = max(aria_t + TEMPLATE_POST, aria_duration - args.search)
+    obs_end_t = aria_end_t = end_score = 0.0
+    if obs_tail < obs_duration and aria_tail < aria_duration:
+        obs_end_t, aria_end_t, end_score = match_beep(obs_path, aria_path, obs_tail, aria_tail, args)
+        print(f'[INFO] Stop beep: obs {obs_end_t:.3f}s aria {aria_end_t:.3f}s (score {end_score:.2f})')
+    if end_score >= args.min_score and obs_end_t > obs_t:
+        end_webcam2 = round(obs_end_t * obs_fps)
+        drift = (aria_end_t - obs_end_t) - (aria_t - obs_t)
+        print(f'[INFO] Drift between aria and OBS over the session: {drift * 1000:.1f}ms')
+        if abs(drift) > 1 / obs_fps:
+            print('[WARNING] Drift is larger than one frame')
+    else:
+        print('[WARNING] Stop beep not found, End_Webcam2_Frame left to 0')
+
+    return start_webcam2, start_aria, end_webcam2
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    rows = []
+    if os.path.exists(args.csv):
+        with open(args.csv, mode='r') as file:
+            rows = [row for row in csv.reader(file) if row]
+    row_index = {tuple(row[:3]): i for i, row in enumerate(rows)}
+
+    all_sessions = sorted(glob(os.path.join(args.input, '*', '*', '*', 'obs.mp4')))
+    print(f'[INFO] Found {len(all_sessions)} sessions...')
+
+    failed = []
+    for obs_path in all_sessions:
+        session_path = os.path.dirname(obs_path)
+        key = Path(session_path).relative_to(args.input).parts
+        print('-' * 80)
+        print(f'Processing {session_path}...')
+        try:
+            start_webcam2, start_aria, end_webcam2 = estimate_session(session_path, args)
+        except Exception as e:
+            print(f'[ERROR] {e}')
+            failed.append(key)
+            continue
+
+        # 0 when the stop beep was not found, not compared with nor written over the CSV
+        estimate = [start_webcam2, start_aria, None, end_webcam2 or None]
+        if key in row_index:
+            row = rows[row_index[key]]
+            current = list(map(int, row[3:7]))
+            diff = [abs(a - b) for a, b in zip(current, estimate) if b is not None]
+            status = 'OK' if max(diff) <= args.tolerance else 'MISMATCH'
+            print(f'[{status}] CSV {current} estimate {estimate}')
+            if args.write:
+                row[3], row[4] = str(start_webcam2), str(start_aria)
+                if end_webcam2:
+                    row[6] = str(end_webcam2)
+        else:
+            print(f'[NEW] estimate {estimate}')
+            # Screen sync is not estimated here, 0 ignores the screen stream
+            row_index[key] = len(rows)
+            rows.append(list(key) + [str(start_webcam2), str(start_aria), '0', str(end_webcam2)])
+
+    if args.write:
+        with open(args.csv, mode='w', newline='') as file:
+            csv.writer(file).writerows(rows)
+        print(f'[INFO] Saved {len(rows)} rows to {args.csv}')
+
+    if failed:
+        print(f'[ERROR] {len(failed)} session(s) could not be synced: {["/".join(k) for k in failed]}')
+        exit(1)
@@ -15,28 +15,116 @@ Dec30
 │   │   ├── screen.png      <- from Repaper Studio
 │   │   └── obs.mp4         <- from OBS
 │   ├── T2 ...
+
+Usage:
+python convert_vrs.py -i [path_to_data_folder]
+Add --jobs N --log-dir [path_to_log_folder] to convert N files in parallel.
+Files already converted from the same VRS are skipped (see manifest.py), use --force to convert again. An aria.mp4
+newer than its aria.vrs is reused as well (converted before manifests existed or by hand).
+vrs_to_mp4 writes to a hidden temporary file that is renamed to aria.mp4 once complete, so an interrupted conversion
+never leaves a truncated aria.mp4 behind.
+
+Add --timestamps to also export the device capture time of every RGB frame (int64 nanoseconds, one per frame of
+aria.mp4) to aria_timestamps.npy with projectaria_tools. Sync can then use the real frame times instead of assuming
+a constant 30 fps.
 """
 import argparse
 import os
 import subprocess
+import sys
 from glob import glob
+from pathlib import Path
+
+import numpy as np
+
+from manifest import Manifest, add_manifest_args
+from scheduler import add_scheduler_args, exit_on_failure, run_sessions, session_name
 
 parser = argparse.ArgumentParser(description='Convert VRS to MP4 using provided Aria Glasses tool.')
 parser.add_argument('-i', '--input', type=str, required=True, help='Path to the collected data folder')
+parser.add_argument('--timestamps', action='store_true',
+                    help='Also export the RGB frame device timestamps to aria_timestamps.npy (needs projectaria_tools)')
+add_manifest_args(parser)
+add_scheduler_args(parser)
 
-args = parser.parse_args()
+TIMESTAMPS_FILE = 'aria_timestamps.npy'
 
 # args.input = 'SOMETIME' # for manual run
 
-all_vrs = sorted(glob(os.path.join(args.input, '*', '*', '*.vrs')))
-print('[INFO] Found', len(all_vrs), 'VRS files...')
+def is_newer(path, source):
+    return os.path.exists(path) and os.path.getmtime(path) > os.path.getmtime(source)
+
+def export_timestamps(vrs, out_file):
+    """Device capture time (ns) of every camera-rgb frame of vrs, saved as an int64 array."""
+    # Only needed for --timestamps, conversion alone does not depend on projectaria_tools
+    from projectaria_tools.core import data_provider
+    from projectaria_tools.core.sensor_data import TimeDomain
+
+    provider = data_provider.create_vrs_data_provider(vrs)
+    stream_id = provider.get_stream_id_from_label('camera-rgb')
+    if stream_id is None:
+        raise ValueError(f'No camera-rgb stream in {vrs}')
+    timestamps = np.array(provider.get_timestamps_ns(stream_id, TimeDomain.DEVICE_TIME), dtype=np.int64)
+
+    tmp_file = os.path.join(os.path.dirname(out_file), f'.{os.path.basename(out_file)}')
+    with open(tmp_file, 'wb') as f:
+        np.save(f, timestamps)
+    os.replace(tmp_file, out_file)
 
-for idx, vrs in enumerate(all_vrs):
-    print(f'Processing {idx+1}/{len(all_vrs)}: {vrs}')
+    fps = (len(timestamps) - 1) / ((timestamps[-1] - timestamps[0]) / 1e9) if len(timestamps) > 1 else 0
+    print(f'Exported {len(timestamps)} frame timestamps to {out_file} (average {fps:.3f} fps)')
+
+def convert(vrs, with_hash=False, force=False, timestamps=False):
     out_file = os.path.join(os.path.dirname(vrs), 'aria.mp4')
-    command = [
-    "vrs_to_mp4",
-    "--vrs", vrs,
-    "--output_video", out_file
-]
-    subprocess.run(command, check=True)
+    timestamps_file = os.path.join(os.path.dirname(vrs), TIMESTAMPS_FILE)
+    outputs = [out_file] + ([timestamps_file] if timestamps else [])
+    # Keep the params of runs without --timestamps as they were, so they stay fresh
+    params = {'timestamps': True} if timestamps else {}
+    manifest = Manifest(os.path.dirname(vrs), with_hash)
+    if not force and manifest.is_fresh('convert', [vrs], params, outputs):
+        print(f'{out_file} is up to date. Skipping...')
+        return
+    if not force and 'convert' not in manifest.stages and all(is_newer(path, vrs) for path in outputs):
+        print(f'{out_file} is newer than {vrs}, recording it as done. Skipping...')
+        manifest.finish('convert', [vrs], params, outputs)
+        return
+
+    print(f'Processing {vrs}')
+    manifest.start('convert', [vrs], params)
+    if not force and is_newer(out_file, vrs):
+        # e.g. only the timestamps were added to an existing conversion
+        print(f'{out_file} is newer than {vrs}, keeping it')
+    else:
+        # Hidden and still ending in .mp4: vrs_to_mp4 picks the container from the extension, and the *.mp4 globs of
+        # the other scripts must not pick up a half-written file
+        tmp_file = os.path.join(os.path.dirname(vrs), '.aria.tmp.mp4')
+        command = [
+            "vrs_to_mp4",
+            "--vrs", vrs,
+            "--output_video", tmp_file
+        ]
+        # Flush first so our own prints stay ordered with the tool output in the session log
+        sys.stdout.flush()
+        try:
+            subprocess.run(command, check=True, stdout=sys.stdout, stderr=subprocess.STDOUT)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+        os.replace(tmp_file, out_file)
+
+    if timestamps:
+        export_timestamps(vrs, timestamps_file)
+    manifest.finish('convert', [vrs], params, outputs)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    all_vrs = sorted(glob(os.path.join(args.input, '*', '*', '*.vrs')))
+    print('[INFO] Found', len(all_vrs), 'VRS files...')
+
+    sessions = [(session_name(*Path(vrs).relative_to(args.input).parent.parts),
+                 (vrs, args.hash, args.force, args.timestamps))
+                for vrs in all_vrs]
+    exit_on_failure(run_sessions(convert, sessions, args.jobs, args.log_dir))
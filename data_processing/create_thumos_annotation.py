@@ -5,6 +5,94 @@ CS PhD @Stony Brook University @University of Adelaide
 Created Jan 13, 2025
 ---------------------
 From webcam2 annotations, create THUMOS like annotation for ActionFormer.
+
+Every P*/T* session with a <stream>_touch_annotation (.npz or .json, see touch_annotation.py) is turned into touch
+segments by run-length encoding its per-frame labels. Touches separated by a short gap are merged and very short ones
+are dropped. Sessions are split into training/validation by participant so a person never appears in both.
+
+Output (single database JSON, video ids match prepare_i3d.py: Px_Tx_webcam2):
+{
+    "version": "PenTouch",
+    "database": {
+        "P1_T1_webcam2": {"subset": "training", "duration": 123.4, "fps": 30.0, "num_frames": 3702,
+                          "annotations": [{"label": "touch", "label_id": 0, "segment": [1.2, 1.9]}, ...]},
+        ...
+    }
+}
+
+Usage:
+python create_thumos_annotation.py -i [path_to_data_folder] -o [output_json] --val P5 P6
 """
 
+import argparse
 import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+from touch_annotation import annotation_exists, load_annotation, touch_segments
+
+parser = argparse.ArgumentParser(description='Create THUMOS like annotation for ActionFormer')
+parser.add_argument('-i', '--input', type=str, default='/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Data',
+                    help='Path to the synced data folder')
+parser.add_argument('-o', '--output', type=str, default=None, help='Output JSON, default <input>/thumos_annotation.json')
+parser.add_argument('-s', '--stream', type=str, default='webcam2', help='Annotated stream to use')
+parser.add_argument('--fps', type=float, default=30.0, help='Frame rate of the synced videos')
+parser.add_argument('--min-duration', type=float, default=0.1, help='Drop touches shorter than this (seconds)')
+parser.add_argument('--merge-gap', type=float, default=0.1, help='Merge touches separated by at most this (seconds)')
+parser.add_argument('--val', type=str, nargs='*', default=None, help='Participants used for validation, e.g. P5 P6')
+parser.add_argument('--val-ratio', type=float, default=0.2,
+                    help='Fraction of participants randomly used for validation when --val is not given')
+parser.add_argument('--seed', type=int, default=0, help='Seed of the random participant split')
+parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Number of sessions processed in parallel')
+
+
+def session_database(session_dir, stream, fps, min_frames, max_gap):
+    labels, _ = load_annotation(session_dir, stream)
+    segments = touch_segments(labels, min_frames, max_gap) / fps
+
+    return {'duration': round(len(labels) / fps, 3), 'fps': fps, 'num_frames': len(labels),
+            'annotations': [{'label': 'touch', 'label_id': 0, 'segment': [round(s, 3), round(e, 3)]}
+                            for s, e in segments.tolist()]}
+
+
+def split_participants(participants, val, val_ratio, seed):
+    if val is not None:
+        return set(val)
+
+    participants = sorted(participants)
+    random.Random(seed).shuffle(participants)
+    return set(participants[:round(len(participants) * val_ratio)])
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    args.input = Path(args.input)
+    output = Path(args.output) if args.output else args.input.joinpath('thumos_annotation.json')
+
+    all_sessions = [s for s in sorted(args.input.glob('P*/T*')) if annotation_exists(s, args.stream)]
+    print(f'[INFO] Total {len(all_sessions)} annotated sessions...')
+
+    min_frames = max(1, round(args.min_duration * args.fps))
+    max_gap = round(args.merge_gap * args.fps)
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        func = partial(session_database, stream=args.stream, fps=args.fps, min_frames=min_frames, max_gap=max_gap)
+        # Sessions are tiny, send them in chunks to keep the inter-process overhead low
+        entries = list(pool.map(func, all_sessions, chunksize=max(1, len(all_sessions) // (4 * max(1, args.jobs)))))
+
+    val_participants = split_participants({s.parent.name for s in all_sessions}, args.val, args.val_ratio, args.seed)
+    print(f'[INFO] Validation participants: {sorted(val_participants)}')
+
+    database = {}
+    for session, entry in zip(all_sessions, entries):
+        entry['subset'] = 'validation' if session.parent.name in val_participants else 'training'
+        database[f'{session.parent.name}_{session.name}_{args.stream}'] = entry
+
+    n_touch = sum(len(entry['annotations']) for entry in database.values())
+    print(f'[INFO] {n_touch} touch segments in {len(database)} videos')
+
+    with open(output, 'w') as f:
+        json.dump({'version': 'PenTouch', 'database': database}, f, indent=4)
+    print(f'[INFO] Saved to {output}')
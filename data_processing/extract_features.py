@@ -0,0 +1,224 @@
+"""
+Huy Anh Nguyen
+CS PhD @Stony Brook University @University of Adelaide
+
+Created Feb 5, 2025
+---------------------
+Extract clip features from the synced videos on CPU, replacing the copy to the video_features repo (prepare_i3d.py).
+
+Every <data>/Px/Tx/videos/<stream>.mp4 is read once, frames are resized (short side to --size) and center cropped, and
+clips of --clip frames starting every --stride frames are fed in batches of -b clips to the extractor. Feature i covers
+frames [i * stride, i * stride + clip). Decoding runs in a background thread and stays a few batches ahead, so it
+overlaps with inference.
+
+Extractors (-e):
+    - i3d: I3D ResNet-50 of pytorchvideo (torch.hub, Kinetics-400 weights) without its classification head, run on
+      CPU, 2048 features per clip. Needs torch.
+    - random: tiny model with fixed random weights (average pooling to a 4x4 grid and a random projection, numpy only),
+      64 features per clip. Same interface and output layout, for tests without torch or weights.
+
+Output: <output>/Px_Tx_<stream>.npy, float32 (or float16 with --fp16) array of shape (num_clips, dim). File names
+match the video ids of create_thumos_annotation.py, so the folder is the feature folder of ActionFormer. The session
+manifest (stage features_<stream>) skips sessions extracted with the same parameters.
+
+Usage:
+python extract_features.py -i [path_to_data_folder] -o [path_to_feature_folder]
+python extract_features.py -i [path_to_data_folder] -o [path_to_feature_folder] -e random    <- no torch needed
+"""
+import argparse
+import os
+import queue
+import threading
+from collections import deque
+from glob import glob
+from pathlib import Path
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+from manifest import Manifest, add_manifest_args
+
+parser = argparse.ArgumentParser(description='Extract clip features from the synced videos on CPU')
+parser.add_argument('-i', '--input', type=str, default='/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Data',
+                    help='Path to the synced data folder')
+parser.add_argument('-o', '--output', type=str, required=True, help='Path to the feature folder')
+parser.add_argument('-s', '--stream', type=str, default='webcam2', help='Synced stream to extract features from')
+parser.add_argument('-e', '--extractor', type=str, default='i3d', choices=['i3d', 'random'], help='Feature extractor')
+parser.add_argument('--clip', type=int, default=16, help='Number of frames per clip')
+parser.add_argument('--stride', type=int, default=4, help='Number of frames between the starts of two clips')
+parser.add_argument('--size', type=int, default=224, help='Side of the square crop fed to the extractor')
+parser.add_argument('-b', '--batch', type=int, default=8, help='Number of clips per inference batch')
+parser.add_argument('--threads', type=int, default=0, help='Number of torch CPU threads, 0 keeps the torch default')
+parser.add_argument('--fp16', action='store_true', help='Save the features as float16')
+add_manifest_args(parser)
+
+
+class RandomExtractor:
+    """Stand-in with fixed random weights: (B, T, H, W, 3) uint8 clips -> (B, dim) features."""
+    def __init__(self, dim=64, grid=4, seed=0):
+        self.dim, self.grid = dim, grid
+        self.weights = np.random.default_rng(seed).standard_normal((grid * grid * 3, dim)).astype(np.float32)
+
+    def __call__(self, clips):
+        b, t, h, w, c = clips.shape
+        g = self.grid
+        # Average over time and over a g x g grid of cells (the crop is cut so it divides evenly)
+        cells = clips[:, :, :h // g * g, :w // g * g].reshape(b, t, g, h // g, g, w // g, c)
+        pooled = cells.mean(axis=(1, 3, 5), dtype=np.float32) / 255
+        return np.tanh(pooled.reshape(b, -1) @ self.weights)
+
+
+class I3DExtractor:
+    """I3D ResNet-50 on CPU without the classification head: (B, T, H, W, 3) uint8 BGR clips -> (B, 2048)."""
+    dim = 2048
+    mean, std = [0.45, 0.45, 0.45], [0.225, 0.225, 0.225]
+
+    def __init__(self, threads=0):
+        # Only needed for -e i3d
+        import torch
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.torch = torch
+        model = torch.hub.load('facebookresearch/pytorchvideo', 'i3d_r50', pretrained=True)
+        # Every block but the head, features are pooled over time and space below so any clip length works
+        self.blocks = model.blocks[:-1].eval()
+        self.mean = torch.tensor(self.mean).view(1, 3, 1, 1, 1)
+        self.std = torch.tensor(self.std).view(1, 3, 1, 1, 1)
+
+    def __call__(self, clips):
+        torch = self.torch
+        with torch.inference_mode():
+            # BGR (B, T, H, W, C) -> RGB (B, C, T, H, W)
+            x = torch.from_numpy(clips[..., ::-1].copy()).permute(0, 4, 1, 2, 3).float().div_(255)
+            x = (x - self.mean) / self.std
+            for block in self.blocks:
+                x = block(x)
+            return x.mean(dim=(2, 3, 4)).numpy()
+
+
+EXTRACTORS = {'i3d': I3DExtractor, 'random': RandomExtractor}
+
+
+def load_extractor(name, threads=0):
+    return I3DExtractor(threads) if name == 'i3d' else EXTRACTORS[name]()
+
+
+def resize_crop(frame, size):
+    """Resize the short side to size and center crop a size x size square."""
+    h, w = frame.shape[:2]
+    scale = size / min(h, w)
+    nh, nw = max(size, round(h * scale)), max(size, round(w * scale))
+    frame = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    y, x = (nh - size) // 2, (nw - size) // 2
+    return frame[y:y + size, x:x + size]
+
+
+def clip_batches(vid, clip_len, stride, size, batch_size, prefetch=4):
+    """Yield (B, clip_len, size, size, 3) uint8 batches of clips starting every stride frames.
+
+    Frames are decoded by a background thread that stays at most prefetch batches ahead. Overlapping clips share their
+    frames, every frame is decoded and resized once.
+    """
+    batches = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    error = []
+
+    def decode():
+        cap = cv2.VideoCapture(vid)
+        window, batch = deque(maxlen=clip_len), []
+        try:
+            frame_number = 0
+            while not stop.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                window.append(resize_crop(frame, size))
+                start = frame_number - clip_len + 1
+                if start >= 0 and start % stride == 0:
+                    batch.append(np.stack(window))
+                    if len(batch) == batch_size:
+                        batches.put(np.stack(batch))
+                        batch = []
+                frame_number += 1
+            if batch:
+                batches.put(np.stack(batch))
+        except Exception as e:
+            error.append(e)
+        finally:
+            cap.release()
+            batches.put(None)
+
+    thread = threading.Thread(target=decode, daemon=True)
+    thread.start()
+    try:
+        while (batch := batches.get()) is not None:
+            yield batch
+    finally:
+        # Consumer stopped early (error in the extractor): unblock and end the decoder
+        stop.set()
+        while thread.is_alive():
+            try:
+                batches.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+    if error:
+        raise error[0]
+
+
+def num_clips(vid, clip_len, stride):
+    cap = cv2.VideoCapture(vid)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return max(0, (frame_count - clip_len) // stride + 1)
+
+
+def extract(vid, out_file, extractor, clip_len, stride, size, batch_size, fp16=False):
+    features = []
+    with tqdm(total=num_clips(vid, clip_len, stride), desc=os.path.basename(out_file), unit='clip') as pbar:
+        for batch in clip_batches(vid, clip_len, stride, size, batch_size):
+            features.append(np.asarray(extractor(batch), dtype=np.float32))
+            pbar.update(len(batch))
+
+    dim = features[0].shape[1] if features else extractor.dim
+    features = np.concatenate(features) if features else np.zeros((0, dim), dtype=np.float32)
+    if fp16:
+        features = features.astype(np.float16)
+
+    tmp_file = os.path.join(os.path.dirname(out_file), f'.{os.path.basename(out_file)}')
+    with open(tmp_file, 'wb') as f:
+        np.save(f, features)
+    os.replace(tmp_file, out_file)
+    return features.shape
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    os.makedirs(args.output, exist_ok=True)
+
+    all_vids = sorted(glob(os.path.join(args.input, '*', '*', 'videos', f'{args.stream}.mp4')))
+    print(f'[INFO] Total {len(all_vids)} videos...')
+
+    stage = f'features_{args.stream}'
+    params = {'extractor': args.extractor, 'clip': args.clip, 'stride': args.stride, 'size': args.size,
+              'fp16': args.fp16}
+    extractor = None
+    for vid in all_vids:
+        session_dir = Path(vid).parents[1]
+        p, t = session_dir.parent.name, session_dir.name
+        out_file = os.path.join(args.output, f'{p}_{t}_{args.stream}.npy')
+
+        manifest = Manifest(session_dir, args.hash)
+        if not args.force and manifest.is_fresh(stage, [vid], params, [out_file]):
+            print(f'[INFO] {out_file} is up to date. Skipping...')
+            continue
+
+        # Loaded once, and only when a session needs it
+        if extractor is None:
+            extractor = load_extractor(args.extractor, args.threads)
+        manifest.start(stage, [vid], params)
+        shape = extract(vid, out_file, extractor, args.clip, args.stride, args.size, args.batch, args.fp16)
+        manifest.finish(stage, [vid], params, [out_file], info={'shape': list(shape)})
+        print(f'[INFO] Saved {shape[0]} x {shape[1]} features to {out_file}')
@@ -0,0 +1,47 @@
+"""
+Huy Anh Nguyen
+CS PhD @Stony Brook University @University of Adelaide
+
+Created Jan 21, 2025
+---------------------
+Frame index used by sync_vids.py --copy index. Instead of copying every JPEG just to renumber it, the synced
+rgb_frames/<stream> folder only contains an index.txt where line i is the path of synced frame i (relative to the
+folder when possible, so the dataset can be moved as a whole).
+
+Readers (annotate_webcam.py, annotate_screen.py, ...) should call list_frames() which handles both a folder of
+real %08d.jpg files and an indexed folder:
+    for name, path in list_frames(frame_dir):
+        img = cv2.imread(str(path))
+"""
+import os
+from pathlib import Path
+
+INDEX_FILE = 'index.txt'
+
+
+def write_index(out_dir, frames):
+    """Write the index of frames (list of source paths) into out_dir."""
+    lines = []
+    for frame in frames:
+        try:
+            lines.append(os.path.relpath(frame, out_dir))
+        except ValueError:
+            # Different drive on Windows, keep the absolute path
+            lines.append(os.path.abspath(frame))
+
+    with open(os.path.join(out_dir, INDEX_FILE), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def list_frames(frame_dir):
+    """Return the sorted list of (frame_name, frame_path) of a rgb_frames/<stream> folder."""
+    frame_dir = Path(frame_dir)
+    index_path = frame_dir.joinpath(INDEX_FILE)
+    if not index_path.exists():
+        return [(path.name, path) for path in sorted(frame_dir.glob('*.jpg'))]
+
+    with open(index_path) as f:
+        sources = [line.strip() for line in f if line.strip()]
+
+    # joinpath keeps absolute entries as they are
+    return [(f'{i:08d}.jpg', frame_dir.joinpath(src)) for i, src in enumerate(sources)]
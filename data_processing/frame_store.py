@@ -0,0 +1,176 @@
+"""
+Huy Anh Nguyen
+CS PhD @Stony Brook University @University of Adelaide
+
+Created Jan 29, 2025
+---------------------
+Frame store: one <stream>.frames folder instead of a folder of millions of %08d.jpg files.
+    <stream>.frames
+    ├── meta.json          <- mode (jpeg or raw), first frame number, frame count, frame shape, scale
+    ├── index.npy          <- (count, 3) int64: chunk, byte offset, byte length of every frame
+    └── chunk_00000.bin... <- frames appended back to back, a new chunk every chunk_bytes
+
+In jpeg mode every frame is a JPEG blob (same size as the files, no per-file overhead), in raw mode it is the uint8
+BGR array (optionally downscaled), which needs no decoding at all. Chunks are opened with np.memmap, so any frame is an
+O(1) lookup. meta.json is written last: a store without it was interrupted and is not readable.
+
+Writing:
+    with FrameStoreWriter('frames/webcam2.frames', mode='jpeg', start=0) as store:
+        store.append(frame)                       # or store.append_encoded(store.encode(frame)) from threads
+Reading (also works for a folder of JPEGs or an index.txt folder, see frame_index.py):
+    frames = open_frames('rgb_frames/webcam2')    # picks rgb_frames/webcam2.frames when it exists
+    img = frames.read(i)                          # i-th frame, name frames.names[i]
+"""
+import json
+import os
+import shutil
+
+import cv2
+import numpy as np
+
+from frame_index import list_frames
+
+STORE_SUFFIX = '.frames'
+REDUCED_FACTOR = {cv2.IMREAD_REDUCED_COLOR_2: 2, cv2.IMREAD_REDUCED_COLOR_4: 4, cv2.IMREAD_REDUCED_COLOR_8: 8}
+
+
+def store_path(folder):
+    return f'{os.fspath(folder).rstrip(os.sep)}{STORE_SUFFIX}'
+
+
+def is_frame_store(path):
+    return os.path.exists(os.path.join(path, 'meta.json'))
+
+
+class FrameStoreWriter:
+    def __init__(self, path, mode='jpeg', start=0, scale=1, quality=95, chunk_bytes=1 << 30):
+        if mode not in ('jpeg', 'raw'):
+            raise ValueError(f'Unknown frame store mode {mode}')
+
+        self.path = path
+        self.mode, self.start, self.scale, self.quality, self.chunk_bytes = mode, start, scale, quality, chunk_bytes
+        self.shape = None
+        self.index = []
+        self.chunk_id, self.offset, self.chunk = -1, 0, None
+
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+
+    def encode(self, frame):
+        """Bytes stored for frame. Thread safe, so frames can be encoded in parallel and appended in order."""
+        if self.scale > 1:
+            frame = cv2.resize(frame, (frame.shape[1] // self.scale, frame.shape[0] // self.scale),
+                               interpolation=cv2.INTER_AREA)
+        if self.mode == 'raw':
+            return frame.shape, np.ascontiguousarray(frame).tobytes()
+
+        ret, blob = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ret:
+            raise IOError(f'Failed to encode frame {len(self.index)} of {self.path}')
+        return frame.shape, blob.tobytes()
+
+    def append_encoded(self, encoded):
+        shape, data = encoded
+        if self.mode == 'raw' and self.shape is not None and tuple(shape) != self.shape:
+            raise ValueError(f'Frame shape {shape} does not match {self.shape} in {self.path}')
+        self.shape = self.shape or tuple(shape)
+
+        if self.chunk is None or self.offset + len(data) > self.chunk_bytes:
+            if self.chunk is not None:
+                self.chunk.close()
+            self.chunk_id += 1
+            self.offset = 0
+            self.chunk = open(os.path.join(self.path, f'chunk_{self.chunk_id:05d}.bin'), 'wb')
+
+        self.chunk.write(data)
+        self.index.append((self.chunk_id, self.offset, len(data)))
+        self.offset += len(data)
+
+    def append(self, frame):
+        self.append_encoded(self.encode(frame))
+
+    def close(self):
+        if self.chunk is not None:
+            self.chunk.close()
+            self.chunk = None
+
+        np.save(os.path.join(self.path, 'index.npy'), np.array(self.index, dtype=np.int64).reshape(-1, 3))
+        meta = {'mode': self.mode, 'start': self.start, 'count': len(self.index), 'scale': self.scale,
+                'shape': list(self.shape) if self.shape else None}
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Leave an interrupted store without meta.json so it is never read as complete
+        if exc_type is None:
+            self.close()
+        elif self.chunk is not None:
+            self.chunk.close()
+
+
+class FrameStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.mode, self.start, self.scale = meta['mode'], meta['start'], meta['scale']
+        self.shape = tuple(meta['shape']) if meta['shape'] else None
+        self.index = np.load(os.path.join(path, 'index.npy'), mmap_mode='r')
+        self.chunks = {}
+        self.names = [f'{self.start + i:08d}.jpg' for i in range(len(self.index))]
+
+    def __len__(self):
+        return len(self.index)
+
+    def _chunk(self, chunk_id):
+        if chunk_id not in self.chunks:
+            self.chunks[chunk_id] = np.memmap(os.path.join(self.path, f'chunk_{chunk_id:05d}.bin'), dtype=np.uint8,
+                                              mode='r')
+        return self.chunks[chunk_id]
+
+    def read_encoded(self, i):
+        """Stored bytes of the i-th frame, to be copied into another store without decoding."""
+        chunk_id, offset, length = self.index[i]
+        return self.shape, self._chunk(chunk_id)[offset:offset + length]
+
+    def read(self, i, flags=cv2.IMREAD_COLOR):
+        """i-th frame as a BGR array. flags can be a cv2.IMREAD_REDUCED_COLOR_* to decode at lower resolution."""
+        _, data = self.read_encoded(i)
+        if self.mode == 'jpeg':
+            return cv2.imdecode(data, flags)
+
+        # Read-only view straight into the memory map
+        frame = data.reshape(self.shape)
+        factor = REDUCED_FACTOR.get(flags, 1)
+        return frame[::factor, ::factor] if factor > 1 else frame
+
+
+class FileFrames:
+    """Same interface as FrameStore for a folder of JPEGs (or an index.txt folder)."""
+
+    def __init__(self, path):
+        self.path = path
+        frames = list_frames(path)
+        self.names = [name for name, _ in frames]
+        self.paths = [str(p) for _, p in frames]
+        self.start = int(self.names[0][:-4]) if self.names else 0
+
+    def __len__(self):
+        return len(self.paths)
+
+    def read(self, i, flags=cv2.IMREAD_COLOR):
+        return cv2.imread(self.paths[i], flags)
+
+
+def open_frames(path):
+    """Open a frame folder, using <folder>.frames when it is (or has) a frame store."""
+    path = os.fspath(path)
+    if is_frame_store(path):
+        return FrameStore(path)
+    if is_frame_store(store_path(path)):
+        return FrameStore(store_path(path))
+    return FileFrames(path)
@@ -0,0 +1,182 @@
+"""
+Huy Anh Nguyen
+CS PhD @Stony Brook University @University of Adelaide
+
+Created Jan 27, 2025
+---------------------
+Per-session processing manifest, so reruns only redo the stages whose inputs, parameters or outputs changed.
+
+<session>/manifest.json records for every stage (convert, frames_obs, sync, annotate_webcam2, ...):
+    - inputs: fingerprint of every input file (size, mtime, optional fast hash) or folder (number of entries, mtime)
+    - params: the parameters that change the result (CSV row, HSV bounds, ...)
+    - outputs: fingerprint of every output, so deleted or modified outputs make the stage stale
+    - status: 'running' while the stage runs, 'done' once finished. A crash leaves 'running', which is stale.
+The file is replaced atomically, so a crash never leaves a half-written manifest. Saves hold an exclusive lock on
+<session>/.manifest.lock, so workers saving different stages of the same session never drop each other's stage.
+
+Usage in a driver:
+    manifest = Manifest(session_dir)
+    if manifest.is_fresh('sync', inputs, params, outputs):
+        print('... up to date. Skipping...')
+        return
+    manifest.start('sync', inputs, params)
+    ...
+    manifest.finish('sync', inputs, params, outputs)
+"""
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = '.manifest.lock'
+HASH_BYTES = 1 << 20  # fast hash reads the first and last MiB only
+
+
+def add_manifest_args(parser):
+    parser.add_argument('--hash', action='store_true',
+                        help='Also record a fast content hash of the inputs, so touched but unchanged files stay fresh')
+    parser.add_argument('--force', action='store_true', help='Ignore the manifest and redo every session')
+
+
+def fast_hash(path):
+    size = os.path.getsize(path)
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        h.update(f.read(HASH_BYTES))
+        if size > HASH_BYTES:
+            f.seek(max(HASH_BYTES, size - HASH_BYTES))
+            h.update(f.read(HASH_BYTES))
+    return h.hexdigest()
+
+
+def fingerprint(path, with_hash=False):
+    """Cheap identity of a file or folder, None if it does not exist."""
+    path = str(path)
+    if not os.path.exists(path):
+        return None
+
+    stat = os.stat(path)
+    if os.path.isdir(path):
+        # Adding or removing an entry changes the folder mtime, no need to stat millions of frames
+        with os.scandir(path) as entries:
+            return {'files': sum(1 for _ in entries), 'mtime_ns': stat.st_mtime_ns}
+
+    res = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        res['hash'] = fast_hash(path)
+    return res
+
+
+def same_fingerprint(path, recorded):
+    current = fingerprint(path)
+    if current is None or recorded is None:
+        return current == recorded
+    if 'files' in recorded:
+        return current == recorded
+    if current['size'] != recorded['size']:
+        return False
+    if current['mtime_ns'] == recorded['mtime_ns']:
+        return True
+    # Touched (copied, restored from backup) but maybe not modified
+    return 'hash' in recorded and fast_hash(path) == recorded['hash']
+
+
+class Manifest:
+    def __init__(self, session_dir, with_hash=False):
+        self.path = os.path.join(session_dir, MANIFEST_FILE)
+        self.with_hash = with_hash
+        self.stages = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.stages = json.load(f)
+
+    def is_fresh(self, stage, inputs, params, outputs):
+        """True if stage finished with the same inputs and params and its outputs were not touched since."""
+        entry = self.stages.get(stage)
+        if entry is None or entry['status'] != 'done':
+            return False
+        if entry['params'] != _jsonable(params):
+            return False
+        if sorted(entry['inputs']) != sorted(map(str, inputs)) or sorted(entry['outputs']) != sorted(map(str, outputs)):
+            return False
+
+        return all(same_fingerprint(p, fp) for p, fp in list(entry['inputs'].items()) + list(entry['outputs'].items()))
+
+    def start(self, stage, inputs, params):
+        self.stages[stage] = {'status': 'running', 'started': time.time(), 'params': _jsonable(params),
+                              'inputs': {str(p): fingerprint(p, self.with_hash) for p in inputs}, 'outputs': {}}
+        self.save(stage)
+
+    def finish(self, stage, inputs, params, outputs, info=None):
+        """Record stage as done. info holds extra results that are not compared (e.g. the selected bbox)."""
+        entry = self.stages.get(stage)
+        if entry is None or entry['status'] != 'running':
+            entry = {'started': time.time(), 'inputs': {str(p): fingerprint(p, self.with_hash) for p in inputs}}
+        # Inputs keep the fingerprint taken by start(), an input modified while running makes the stage stale
+        entry.update({'status': 'done', 'finished': time.time(), 'params': _jsonable(params),
+                      'outputs': {str(p): fingerprint(p, self.with_hash) for p in outputs}})
+        if info is not None:
+            entry['info'] = _jsonable(info)
+        self.stages[stage] = entry
+        self.save(stage)
+
+    def update_outputs(self, stage, params, outputs, info=None):
+        """Re-record params and outputs of a finished stage whose outputs were rewritten from its own results (e.g.
+        labels re-thresholded from saved scores). Inputs keep their recorded fingerprint, the stage must be fresh."""
+        entry = self.stages.get(stage)
+        if entry is None or entry['status'] != 'done':
+            raise ValueError(f'Stage {stage} is not done, it cannot be updated')
+        entry.update({'finished': time.time(), 'params': _jsonable(params),
+                      'outputs': {str(p): fingerprint(p, self.with_hash) for p in outputs}})
+        if info is not None:
+            entry['info'] = _jsonable(info)
+        self.save(stage)
+
+    def save(self, stage):
+        # Other stages of the same session may be saved by another worker (e.g. obs.mp4 and aria.mp4 extracted in
+        # parallel), so merge into the latest file instead of overwriting it with our copy
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with _locked(os.path.join(os.path.dirname(self.path), LOCK_FILE)):
+            stages = {}
+            if os.path.exists(self.path):
+                with open(self.path) as f:
+                    stages = json.load(f)
+            stages[stage] = self.stages[stage]
+
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(stages, f, indent=4)
+            os.replace(tmp_path, self.path)
+        self.stages = stages
+
+
+@contextmanager
+def _locked(path):
+    """Exclusive lock on path (created if needed) across processes, released on exit."""
+    with open(path, 'a+') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _jsonable(value):
+    """Params as they would read back from JSON (tuples -> lists, numpy -> python)."""
+    return json.loads(json.dumps(value, default=lambda o: o.tolist() if hasattr(o, 'tolist') else str(o)))
@@ -5,29 +5,140 @@ CS PhD @Stony Brook University @University of Adelaide
 Created Jan 14, 2025
 ---------------------
 Prepare for I3D feature extraction using video_features github repo.
-Convert webcam2.mp4 to Px_Tx_webcam2.mp4.
+Export webcam2.mp4 as Px_Tx_webcam2.mp4 (--mode):
+    - copy: copy the video, as before
+    - symlink / hardlink: link to the video instead of duplicating it (hardlinks need the output on the same drive)
+    - manifest: only write the index below, for tools that take a list of paths
+
+Every mode also writes <output>/videos.json, one entry per video:
+    {"P1_T1_webcam2": {"path": "/.../P1/T1/webcam2.mp4", "duration": 123.4, "num_frames": 3702, "fps": 30.0,
+                       "source": {"size": ..., "mtime_ns": ...}}, ...}
+Duration, frame count and frame rate are read in parallel from the container headers with ffprobe, nothing is decoded.
+The export is incremental: videos whose fingerprint (see manifest.py) did not change keep their index entry and their
+exported file, so adding sessions only probes and exports the new ones. Removed videos are dropped from the index
+and the output folder.
+
+Usage:
+python prepare_i3d.py -i [path_to_data_folder] -o [path_to_output_folder] --mode symlink
+(extract_features.py extracts the features directly, without video_features)
 """
 import argparse
+import json
 import os
 import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
+from pathlib import Path
+
+from manifest import fingerprint, same_fingerprint
 
 parser = argparse.ArgumentParser(description='Prepare for I3D feature extraction')
 parser.add_argument('-i', '--input', type=str, required=False, help='Path to the collected data folder')
 parser.add_argument('-o', '--output', type=str, required=False, help='Path to the output folder')
+parser.add_argument('--mode', type=str, default='copy', choices=['copy', 'symlink', 'hardlink', 'manifest'],
+                    help='How videos are exported')
+parser.add_argument('--ffprobe', type=str, default='ffprobe', help='Path to the ffprobe executable')
+parser.add_argument('-w', '--workers', type=int, default=8, help='Number of videos probed in parallel')
+
+INDEX_FILE = 'videos.json'
+
+
+def probe(path, ffprobe='ffprobe'):
+    """Duration (s), frame count and frame rate of the first video stream, from the container headers."""
+    out = subprocess.run([ffprobe, '-v', 'error', '-select_streams', 'v:0', '-show_entries',
+                          'stream=nb_frames,avg_frame_rate,duration:format=duration', '-of', 'json', path],
+                         capture_output=True, text=True, check=True).stdout
+    info = json.loads(out)
+    stream = info['streams'][0]
+    num, den = map(float, stream.get('avg_frame_rate', '0/0').split('/'))
+    fps = num / den if den else 0.0
+    duration = float(stream.get('duration') or info.get('format', {}).get('duration') or 0)
+    # Some containers (e.g. mkv) have no frame count in their headers
+    num_frames = int(stream['nb_frames']) if stream.get('nb_frames', 'N/A') != 'N/A' else round(duration * fps)
+    return {'duration': round(duration, 3), 'num_frames': num_frames, 'fps': round(fps, 3)}
+
+
+def is_exported(vid, out_file, mode):
+    if mode == 'manifest':
+        return True
+    if not os.path.lexists(out_file):
+        return False
+    if mode == 'symlink':
+        return os.path.islink(out_file) and os.readlink(out_file) == vid
+    if mode == 'hardlink':
+        return not os.path.islink(out_file) and os.path.samefile(vid, out_file)
+    # copy2 keeps the mtime, so an up to date copy has the fingerprint of its source
+    return not os.path.islink(out_file) and fingerprint(out_file) == fingerprint(vid)
+
+
+def export(vid, out_file, mode):
+    # Written next to the target and renamed, so an interrupted copy never looks exported
+    tmp_file = os.path.join(os.path.dirname(out_file), f'.{os.path.basename(out_file)}')
+    if os.path.lexists(tmp_file):
+        os.remove(tmp_file)
+    if mode == 'symlink':
+        os.symlink(vid, tmp_file)
+    elif mode == 'hardlink':
+        os.link(vid, tmp_file)
+    else:
+        shutil.copy2(vid, tmp_file)
+    os.replace(tmp_file, out_file)
+
+
+def load_index(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_index(path, index):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    os.makedirs(args.output, exist_ok=True)
 
-args = parser.parse_args()
+    all_vids = sorted(glob(os.path.join(args.input, '*', '*', 'webcam2.mp4')))
+    print(f'[INFO] Total {len(all_vids)} videos...')
 
-all_vids = glob(os.path.join(args.input, '*', '*', 'webcam2.mp4'))
-print(f'[INFO] Total {len(all_vids)} videos...')
+    videos = {}
+    for vid in all_vids:
+        if '.DS_Store' in vid: # annoying macOS
+            continue
+        # Px_Tx from the folder names, whatever the path separator
+        p, t = Path(vid).parts[-3], Path(vid).parts[-2]
+        videos[f'{p}_{t}_webcam2'] = os.path.abspath(vid)
 
-for vid in all_vids:
-    if '.DS_Store' in vid: # annoying macOS
-        continue
+    index_path = os.path.join(args.output, INDEX_FILE)
+    old_index = load_index(index_path)
+    index = {key: entry for key, entry in old_index.items()
+             if videos.get(key) == entry['path'] and same_fingerprint(entry['path'], entry['source'])}
+    for key in sorted(old_index.keys() - videos.keys()):
+        # Only files listed in our own index are removed, never other files of the output folder
+        out_file = os.path.join(args.output, f'{key}.mp4')
+        if os.path.lexists(out_file):
+            os.remove(out_file)
+        print(f'[INFO] {key} was removed, dropping it from the export')
 
-    # Copy webcam2.mp4 to Px_Tx_webcam2.mp4
-    p, t = vid.split('/')[-3], vid.split('/')[-2]
-    shutil.copy(vid, os.path.join(args.output, f'{p}_{t}_webcam2.mp4'))
-    print(f'[INFO] Copied {vid} to {os.path.join(args.output, f"{p}_{t}_webcam2.mp4")}')
+    to_probe = [key for key in videos if key not in index]
+    print(f'[INFO] Probing {len(to_probe)} new or changed videos...')
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for key, info in zip(to_probe, pool.map(lambda key: probe(videos[key], args.ffprobe), to_probe)):
+            index[key] = {'path': videos[key], **info, 'source': fingerprint(videos[key])}
 
+    exported = 0
+    for key, vid in videos.items():
+        out_file = os.path.join(args.output, f'{key}.mp4')
+        if not is_exported(vid, out_file, args.mode):
+            export(vid, out_file, args.mode)
+            exported += 1
+            print(f'[INFO] Exported ({args.mode}) {vid} to {out_file}')
 
+    save_index(index_path, dict(sorted(index.items())))
+    print(f'[INFO] Exported {exported} videos, {len(videos) - exported} up to date. Index: {index_path}')
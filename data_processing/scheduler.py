@@ -0,0 +1,94 @@
+"""
+Huy Anh Nguyen
+CS PhD @Stony Brook University @University of Adelaide
+
+Created Jan 20, 2025
+---------------------
+Shared session scheduler for the batch drivers (video_to_frames, sync_vids, convert_vrs).
+Each session is processed by a worker of a process pool. When a log folder is given, everything a session prints
+(including subprocess output and tqdm bars) goes to <log_dir>/<session>.log instead of the console.
+A failed session does not stop the others; the driver exits with a non-zero code at the end instead.
+
+Usage in a driver:
+    add_scheduler_args(parser)
+    ...
+    if __name__ == '__main__':
+        sessions = [(name, (arg1, arg2)), ...]
+        exit_on_failure(run_sessions(process_session, sessions, args.jobs, args.log_dir))
+
+The per-session function has to live at module level and the driver code has to be under the __main__ guard,
+because worker processes re-import the script (spawn is the default on macOS).
+"""
+import contextlib
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def add_scheduler_args(parser):
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of sessions processed in parallel')
+    parser.add_argument('--log-dir', type=str, default=None,
+                        help='Write one log file per session into this folder instead of printing to the console')
+
+
+def session_name(*parts):
+    """Turn path parts like ('Dec30', 'P1', 'T1') into a file name safe session name."""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', '_'.join(str(p) for p in parts if p)).strip('_')
+
+
+def _run_session(func, name, args, log_dir):
+    start = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if log_dir is not None:
+            log = stack.enter_context(open(os.path.join(log_dir, f'{name}.log'), 'a'))
+            stack.enter_context(contextlib.redirect_stdout(log))
+            stack.enter_context(contextlib.redirect_stderr(log))
+
+        try:
+            func(*args)
+        except Exception as e:
+            traceback.print_exc()
+            return name, f'{type(e).__name__}: {e}', time.perf_counter() - start
+
+    return name, None, time.perf_counter() - start
+
+
+def run_sessions(func, sessions, jobs=1, log_dir=None):
+    """Run func(*args) for every (name, args) in sessions. Return the list of (name, error) that failed."""
+    if log_dir is not None:
+        os.makedirs(log_dir, exist_ok=True)
+
+    print(f'[INFO] Scheduling {len(sessions)} sessions on {jobs} worker(s)')
+    failed = []
+
+    def report(result, done):
+        name, error, elapsed = result
+        if error is None:
+            print(f'[INFO] ({done}/{len(sessions)}) {name} finished in {elapsed:.1f}s')
+        else:
+            print(f'[ERROR] ({done}/{len(sessions)}) {name} failed after {elapsed:.1f}s: {error}')
+            failed.append((name, error))
+
+    if jobs <= 1:
+        for done, (name, args) in enumerate(sessions, 1):
+            report(_run_session(func, name, args, log_dir), done)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(_run_session, func, name, args, log_dir) for name, args in sessions]
+            for done, future in enumerate(as_completed(futures), 1):
+                report(future.result(), done)
+
+    return failed
+
+
+def exit_on_failure(failed):
+    if failed:
+        print(f'[ERROR] {len(failed)} session(s) failed:')
+        for name, error in failed:
+            print(f'    {name}: {error}')
+        sys.exit(1)
+
+    print('[INFO] All sessions finished successfully')
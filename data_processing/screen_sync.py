@@ -0,0 +1,288 @@
+"""
+Huy Anh Nguyen
+CS PhD @Stony Brook University @University of Adelaide
+
+Created Jan 25, 2025
+---------------------
+Estimate Start_Screen_Frame of manual_sync.csv from the UNIX timestamp shown on the captured screen, without OCR.
+
+The timestamp region (--roi, in screen quadrant coordinates) is binarized, split into glyphs by column projection and
+every glyph is matched against 10 digit templates at once (normalized correlation as a single matrix product).
+Only a sparse subset of frames is decoded (seek every --step seconds):
+    - 13 digit (ms) timestamps give the screen clock of the frame directly.
+    - 10 digit (s) timestamps are refined by a binary search for the frame where the second changes, which is frame
+      accurate.
+Sampling stops as soon as --confident readings agree within one frame. The result is the screen clock at OBS frame 0.
+
+Webcam2 frames follow the real clock: frame f was captured at obs_start + f / fps, obs_start being the UNIX time of
+the first OBS frame. It is taken from --obs-start, else from the OBS start command of the recorder sidecar
+(<session>/session.json, see data_collection/controller.py). Without either the session fails: the obs.mp4 modification
+time minus its duration is only used with --obs-start-mtime, as any copy or touch of the file shifts it. The screen
+frame showing the same instant as Start_Webcam2_Frame is Start_Screen_Frame, End_Screen_Frame likewise for
+End_Webcam2_Frame.
+
+Digit templates are rendered with an OpenCV font by default. For the real screen font, build them once from a frame
+whose timestamp is known:
+python screen_sync.py --make-templates [obs.mp4] [frame_number] [timestamp] --templates digits.npz --roi x1 y1 x2 y2
+
+Usage:
+python screen_sync.py -i [path_to_raw_folder] -c [csv_sync_file] --roi x1 y1 x2 y2 [--templates digits.npz] [--write]
+"""
+import argparse
+import csv
+import json
+import os
+
+import cv2
+import numpy as np
+
+from sync_vids import SIDECAR_FILE
+from video_to_frames import OBS_CROPS
+
+parser = argparse.ArgumentParser(description='Estimate the screen sync frame from the on-screen UNIX timestamp')
+parser.add_argument('-i', '--input', type=str, default='/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Raw',
+                    help='Path to the collected raw data folder')
+parser.add_argument('-c', '--csv', type=str, default='/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Raw/manual_sync.csv',
+                    help='Path to the CSV file')
+parser.add_argument('--roi', type=int, nargs=4, required=True, metavar=('X1', 'Y1', 'X2', 'Y2'),
+                    help='Timestamp region inside the screen quadrant')
+parser.add_argument('--templates', type=str, default=None, help='Digit templates (.npz) created by --make-templates')
+parser.add_argument('--make-templates', type=str, nargs=3, default=None, metavar=('VIDEO', 'FRAME', 'TIMESTAMP'),
+                    help='Build digit templates from a frame with a known timestamp and save them to --templates')
+parser.add_argument('--obs-start', type=float, default=None, help='UNIX time of the first OBS frame')
+parser.add_argument('--obs-start-mtime', action='store_true',
+                    help='Without --obs-start or session.json, estimate the OBS start from the obs.mp4 modification time')
+parser.add_argument('--step', type=float, default=5.0, help='Seconds between sampled frames')
+parser.add_argument('--confident', type=int, default=3, help='Number of agreeing readings needed')
+parser.add_argument('--threshold', type=float, default=0.6, help='Minimum template score of every digit')
+parser.add_argument('--write', action='store_true', help='Write Start_Screen_Frame to the CSV')
+
+TEMPLATE_SIZE = (16, 24)  # (width, height) every glyph is resized to
+
+
+def binarize(crop):
+    """Digits white on black, whatever the screen theme."""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if np.count_nonzero(binary) > binary.size / 2:
+        binary = 255 - binary
+    return binary
+
+
+def split_glyphs(binary):
+    """Split a binarized text line into glyphs by column projection. Return (n, h*w) normalized vectors."""
+    columns = np.concatenate([[0], np.count_nonzero(binary, axis=0) > 0, [0]]).astype(np.int8)
+    edges = np.diff(columns)
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        # Blank or uniform region (dark frame, screen off)
+        return np.zeros((0, TEMPLATE_SIZE[0] * TEMPLATE_SIZE[1]), dtype=np.float32)
+
+    glyphs = []
+    for x1, x2 in zip(starts, ends):
+        rows = np.flatnonzero(np.count_nonzero(binary[:, x1:x2], axis=1))
+        glyph = binary[rows[0]:rows[-1] + 1, x1:x2]
+        glyphs.append(cv2.resize(glyph, TEMPLATE_SIZE, interpolation=cv2.INTER_AREA).ravel())
+
+    return normalize(np.array(glyphs, dtype=np.float32).reshape(len(glyphs), -1))
+
+
+def normalize(vectors):
+    vectors = vectors - vectors.mean(axis=1, keepdims=True)
+    return vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-6)
+
+
+def render_templates():
+    """Default digit templates rendered with an OpenCV font."""
+    canvas = np.zeros((60, 40 * 10), dtype=np.uint8)
+    for digit in range(10):
+        cv2.putText(canvas, str(digit), (40 * digit + 5, 45), cv2.FONT_HERSHEY_SIMPLEX, 1.5, 255, 3)
+    return split_glyphs(canvas)
+
+
+def make_templates(video, frame_number, timestamp, roi, out_path):
+    glyphs = split_glyphs(binarize(read_roi(cv2.VideoCapture(video), frame_number, roi)))
+    if len(glyphs) != len(timestamp):
+        raise ValueError(f'Found {len(glyphs)} glyphs for timestamp {timestamp}, adjust --roi')
+
+    templates = render_templates()
+    for digit in range(10):
+        samples = glyphs[[c == str(digit) for c in timestamp]]
+        if len(samples):
+            templates[digit] = normalize(samples.mean(axis=0, keepdims=True))[0]
+        else:
+            print(f'[WARNING] Digit {digit} not in {timestamp}, using the rendered template')
+
+    np.savez(out_path, templates=templates)
+    print(f'[INFO] Saved digit templates to {out_path}')
+
+
+def read_roi(cap, frame_number, roi):
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+    ret, frame = cap.read()
+    if not ret:
+        return None
+    x1, y1, x2, y2 = roi
+    return frame[OBS_CROPS['screen']][y1:y2, x1:x2]
+
+
+def read_timestamp(crop, templates, threshold):
+    """UNIX time (seconds, float) shown in crop, or None when a digit is not recognized confidently."""
+    if crop is None:
+        return None
+
+    glyphs = split_glyphs(binarize(crop))
+    if len(glyphs) not in (10, 13):
+        return None
+
+    # (n_glyphs, 10) correlation of every glyph with every digit template
+    scores = glyphs @ templates.T
+    if scores.max(axis=1).min() < threshold:
+        return None
+
+    value = int(''.join(map(str, scores.argmax(axis=1))))
+    return value / 1000 if len(glyphs) == 13 else float(value)
+
+
+class ScreenClock:
+    """Sparse reader of the on-screen timestamp of one obs.mp4."""
+
+    def __init__(self, video, roi, templates, threshold):
+        self.cap = cv2.VideoCapture(video)
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        # Unreadable video: 0 or -1 depending on the OpenCV version
+        self.fps = fps if fps > 0 else 30.0
+        self.n_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.roi, self.templates, self.threshold = roi, templates, threshold
+        self.decoded = 0
+
+    def read(self, frame_number):
+        self.decoded += 1
+        return read_timestamp(read_roi(self.cap, frame_number, self.roi), self.templates, self.threshold)
+
+    def transition(self, lo, hi, value):
+        """First frame in (lo, hi] whose timestamp is greater than value (binary search)."""
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            reading = self.read(mid)
+            if reading is not None and reading > value:
+                hi = mid
+            else:
+                lo = mid
+        return hi
+
+    def offset(self, step, confident):
+        """Screen UNIX time at OBS frame 0, from the first `confident` readings agreeing within one frame."""
+        offsets = []
+        previous = None
+        for frame_number in range(0, self.n_frames, max(1, int(step * self.fps))):
+            reading = self.read(frame_number)
+            if reading is None:
+                previous = None
+                continue
+
+            if reading != int(reading):
+                offsets.append(reading - frame_number / self.fps)
+            elif previous is not None and reading > previous[1]:
+                # Second resolution: the frame where the second changes shows exactly reading.000
+                first = self.transition(previous[0], frame_number, previous[1])
+                exact = self.read(first)
+                if exact is not None:
+                    offsets.append(exact - first / self.fps)
+            previous = (frame_number, reading)
+
+            if len(offsets) >= confident:
+                recent = np.array(offsets[-confident:])
+                if np.ptp(recent) <= 1 / self.fps:
+                    return float(np.median(recent))
+
+        raise ValueError(f'Timestamp not read confidently ({len(offsets)} readings), check --roi and --templates')
+
+    def release(self):
+        self.cap.release()
+
+
+def sidecar_obs_start(session_path):
+    """UNIX time of the first OBS frame from the recorder sidecar (middle of the start command), None without one."""
+    sidecar = os.path.join(session_path, SIDECAR_FILE)
+    if not os.path.exists(sidecar):
+        return None
+    with open(sidecar) as f:
+        events = json.load(f)['events']
+    starts = [e for e in events if e['device'] == 'obs' and e['command'] == 'start' and e['error'] is None]
+    if not starts:
+        return None
+    return (starts[-1]['sent_wall_ns'] + starts[-1]['ack_wall_ns']) / 2e9
+
+
+def obs_start_time(obs_path, fps, n_frames):
+    # OBS finalizes the file when recording stops
+    return os.path.getmtime(obs_path) - n_frames / fps
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    if args.make_templates:
+        video, frame_number, timestamp = args.make_templates
+        make_templates(video, int(frame_number), timestamp, args.roi, args.templates or 'digits.npz')
+        exit(0)
+
+    templates = np.load(args.templates)['templates'] if args.templates else render_templates()
+
+    with open(args.csv, mode='r') as file:
+        rows = [row for row in csv.reader(file) if row]
+
+    failed = []
+    for row in rows:
+        obs_path = os.path.join(args.input, *row[:3], 'obs.mp4')
+        print('-' * 80)
+        print(f'Processing {obs_path}...')
+        if not os.path.exists(obs_path):
+            print('[WARNING] obs.mp4 not found. Skipping...')
+            continue
+
+        obs_start = args.obs_start if args.obs_start is not None else sidecar_obs_start(os.path.dirname(obs_path))
+        # Checked before decoding anything
+        if obs_start is None and not args.obs_start_mtime:
+            print(f'[ERROR] No {SIDECAR_FILE} with the OBS start, give --obs-start (or --obs-start-mtime)')
+            failed.append(row[:3])
+            continue
+
+        clock = ScreenClock(obs_path, args.roi, templates, args.threshold)
+        try:
+            screen_offset = clock.offset(args.step, args.confident)
+        except ValueError as e:
+            print(f'[ERROR] {e}')
+            failed.append(row[:3])
+            continue
+        finally:
+            clock.release()
+
+        if obs_start is None:
+            print('[WARNING] OBS start estimated from the obs.mp4 modification time, wrong if the file was copied')
+            obs_start = obs_start_time(obs_path, clock.fps, clock.n_frames)
+        # Screen frame s shows screen_offset + s / fps, webcam frame w was captured at obs_start + w / fps
+        lag = round((obs_start - screen_offset) * clock.fps)
+        start_webcam2, end_webcam2 = int(row[3]), int(row[6])
+        start_screen = start_webcam2 + lag
+        end_screen = end_webcam2 + lag if end_webcam2 else 0
+        print(f'[INFO] Decoded {clock.decoded} frames, screen lag {lag} frames')
+        print(f'[INFO] Start_Screen_Frame {start_screen} (CSV {row[5]}), End_Screen_Frame {end_screen}')
+
+        if not 0 < start_screen < clock.n_frames:
+            print('[ERROR] Start_Screen_Frame is outside of the video')
+            failed.append(row[:3])
+            continue
+
+        if args.write:
+            row[5] = str(start_screen)
+
+    if args.write:
+        with open(args.csv, mode='w', newline='') as file:
+            csv.writer(file).writerows(rows)
+        print(f'[INFO] Saved {len(rows)} rows to {args.csv}')
+
+    if failed:
+        print(f'[ERROR] {len(failed)} session(s) could not be synced: {["/".join(k) for k in failed]}')
+        exit(1)
@@ -35,134 +35,512 @@ The script will create a synced rgb_frames and videos folder in a similar struct
 
 Usage:
 python sync_vids.py --input [path_to_input_folder] --output [path_to_output_folder] --csv [csv_sync_file]
+Add --copy hardlink|reflink|index to avoid duplicating every JPEG into rgb_frames (see frame_index.py).
+Add --encoder ffmpeg [--codec libx264 --preset veryfast --crf 23] to encode H.264 through an ffmpeg pipe
+(see video_writer.py) instead of OpenCV mp4v.
+Add --jobs N --log-dir [path_to_log_folder] to sync N sessions in parallel.
+
+Sessions are skipped when their manifest.json (see manifest.py) shows the same CSV row, options and inputs and
+untouched outputs. A stale or half-finished output folder is removed and synced again. Folders synced before manifests
+existed are kept and recorded as done, like the annotations; use --force to sync them again.
+
+By default the script reads the frames/ folders created by video_to_frames.py. With --source video it reads obs.mp4
+and aria.mp4 directly instead, seeks to the sync frames and writes every synced video (and rgb_frames, unless
+--no-rgb-frames is given) in a single decode pass, so video_to_frames.py does not need to be run at all.
+
+Frame stores (<stream>.frames, see frame_store.py) written by video_to_frames.py --store are read like frame folders,
+and the synced window is copied into rgb_frames/<stream>.frames blob by blob without decoding. With --source video,
+--store jpeg|raw writes rgb_frames as frame stores instead of JPEG files.
+
+The recorder (data_collection/script.py) writes <name>_session.json with the start/stop timestamps of both devices and
+of the sync beeps. Copied next to obs.mp4 as session.json, --sidecar uses it as an initial offset: sessions missing from
+the CSV are synced from the sidecar estimate and the CSV rows are compared with it.
+
+By default every stream advances one frame per synced frame from its sync frame (constant 30 fps assumed). With
+--align timestamps the streams are matched by nearest frame timestamp instead (container PTS, or the Aria device
+times exported by convert_vrs.py --timestamps), so drift between Aria and OBS does not build up over long sessions.
+Either way the table of source frames used is saved to videos/alignment.csv (see alignment.py).
 """
 import argparse
 import csv
+import ctypes
+import json
 import os
 import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
 
 import cv2
 import numpy as np
 
-parser = argparse.ArgumentParser(description='Sync videos and frames')
-parser.add_argument('-i', '--input', type=str, required=False, help='Path to the collected raw data folder')
-parser.add_argument('-o', '--output', type=str, required=False, help='Path to the output folder')
-parser.add_argument('-c', '--csv', type=str, required=False, help='Path to the CSV file')
-
-args = parser.parse_args()
-
-# for manual run or debugging
-args.input = '/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Raw'
-args.output = '/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Data'
-args.csv = '/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Raw/manual_sync.csv'
-
-def create_video(out_path, frames):
-    print(f'Creating video: {out_path}')
-    # Create a video from a list of frame dirs
-    fps = 30.0
-    frame = cv2.imread(frames[0])
-    frame_size = (frame.shape[1], frame.shape[0])
-
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(out_path, fourcc, fps, frame_size)
-
-    for frame in frames:
-        img = cv2.imread(frame)
-        out.write(img)
+from alignment import ALIGNMENT_FILE, ARIA_TIMESTAMPS, STREAMS as ALIGN_STREAMS, build_alignment, save_alignment
+from frame_index import write_index
+from frame_store import FrameStore, FrameStoreWriter, is_frame_store, store_path
+from video_to_frames import OBS_CROPS, open_video
+from video_writer import add_writer_args, open_writer, release_all, writer_config
+from manifest import Manifest, add_manifest_args
+from scheduler import add_scheduler_args, exit_on_failure, run_sessions, session_name
 
-    out.release()
-
-    return frames
+# defaults for manual run or debugging
+parser = argparse.ArgumentParser(description='Sync videos and frames')
+parser.add_argument('-i', '--input', type=str, default='/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Raw',
+                    help='Path to the collected raw data folder')
+parser.add_argument('-o', '--output', type=str, default='/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Data',
+                    help='Path to the output folder')
+parser.add_argument('-c', '--csv', type=str, default='/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Raw/manual_sync.csv',
+                    help='Path to the CSV file')
+parser.add_argument('-s', '--source', type=str, default='frames', choices=['frames', 'video'],
+                    help='Read the extracted frames/ folders or decode obs.mp4 and aria.mp4 directly')
+parser.add_argument('--no-rgb-frames', action='store_true',
+                    help='With --source video, only write the synced videos and skip the rgb_frames JPEGs')
+parser.add_argument('--copy', type=str, default='copy', choices=['copy', 'hardlink', 'reflink', 'index'],
+                    help='How --source frames fills rgb_frames: real copies, hardlinks, copy-on-write clones or an '
+                         'index.txt pointing at the source frames (falls back to copy across devices)')
+parser.add_argument('--store', type=str, default=None, choices=['jpeg', 'raw'],
+                    help='With --source video, write rgb_frames as frame stores of JPEG blobs or raw arrays')
+parser.add_argument('-w', '--workers', type=int, default=4,
+                    help='Threads per session used to decode and resize frames for the combined video')
+parser.add_argument('--align', type=str, default='index', choices=['index', 'timestamps'],
+                    help='Align the streams by frame index (constant frame rate) or by nearest frame timestamp')
+parser.add_argument('--ffprobe', type=str, default='ffprobe', help='Path to the ffprobe executable (--align timestamps)')
+parser.add_argument('--sidecar', action='store_true',
+                    help='Estimate the sync of sessions missing from the CSV from their session.json recorder sidecar')
+# Now the default, kept so older command lines still parse
+parser.add_argument('--trust-existing', action='store_true', help=argparse.SUPPRESS)
+add_writer_args(parser)
+add_manifest_args(parser)
+add_scheduler_args(parser)
+
+COMBINED_RESOLUTION = (2560, 1440)
+SIDECAR_FILE = 'session.json'
+
+def reflink(src, dst):
+    """Copy-on-write clone of src (APFS, Btrfs, XFS). Raise OSError if the filesystem does not support it."""
+    if sys.platform == 'darwin':
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), src)
+    elif sys.platform.startswith('linux'):
+        import fcntl
+        FICLONE = 0x40049409
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            except OSError:
+                fdst.close()
+                os.remove(dst)
+                raise
+    else:
+        raise OSError(f'Reflink is not supported on {sys.platform}')
+
+def copy_frame(out_path, frames, strategy='copy'):
+    """Renumber frames into out_path as %08d.jpg. strategy: copy, hardlink, reflink or index (see frame_index.py)."""
+    print(f'Copying frames to: {out_path} ({strategy})')
+    if strategy == 'index':
+        write_index(out_path, frames)
+        return frames
+
+    if strategy != 'copy' and frames and os.stat(frames[0]).st_dev != os.stat(out_path).st_dev:
+        print('[WARNING] Source and destination are on different devices, falling back to copy')
+        strategy = 'copy'
 
-def copy_frame(out_path, frames):
-    print(f'Copying frames to: {out_path}')
     for i, frame in enumerate(frames):
         destination = os.path.join(out_path, f'{i:08d}.jpg')
+        if strategy == 'hardlink':
+            try:
+                os.link(frame, destination)
+                continue
+            except OSError as e:
+                print(f'[WARNING] Hardlink failed ({e}), falling back to copy')
+                strategy = 'copy'
+        elif strategy == 'reflink':
+            try:
+                reflink(frame, destination)
+                continue
+            except OSError as e:
+                print(f'[WARNING] Reflink failed ({e}), falling back to copy')
+                strategy = 'copy'
+
         shutil.copy(frame, destination)
 
     return frames
 
-def create_combined_video(out_path, webcam1_frames, webcam2_frames, aria_frames, screen_frames=None):
-    resolution = (2560, 1440)
-    fps = 30.0
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(out_path, fourcc, fps, resolution)
-    all_frames = zip(webcam1_frames, webcam2_frames, aria_frames, screen_frames) if screen_frames else zip(webcam1_frames, webcam2_frames, aria_frames)
-    for frames in all_frames:
-        frame = np.zeros((1440, 2560, 3), dtype=np.uint8)
-        frame[:720, :1280] = cv2.resize(cv2.imread(frames[0]), (1280, 720))
-        frame[:720, 1280:] = cv2.resize(cv2.imread(frames[1]), (1280, 720))
-        aria = cv2.resize(cv2.imread(frames[2]), (720, 720))
-        offset = (1280 - 720) // 2
-
-        frame[720:, offset:offset+720] = aria
-        if screen_frames:
-            screen = cv2.resize(cv2.imread(frames[3]), (1280, 720))
-            frame[720:, 1280:] = screen
-
-        out.write(frame)
-
-    out.release()
-
-
-# Open the file
-with open(args.csv, mode='r') as file:
-    csv_reader = csv.reader(file)  # Create a CSV reader object
-
-    # Iterate through the rows
-    for row in csv_reader:
-        base_path = os.path.join(*([args.input] + row[:3] + ['frames']))
-        desc_path = os.path.join(*([args.output] + row[1:3]))
-        print('-'*80)
-        if os.path.exists(desc_path):
-            print(f'Folder {desc_path} already exists. Skipping...')
-            continue
-        else:
-            print(f'Processing {base_path}...')
-
-        desc_video_path = os.path.join(desc_path, 'videos')
-        desc_frame_path = os.path.join(desc_path, 'rgb_frames')
+def copy_store(out_path, frames):
+    """Copy the (store, index) frames into a new store at out_path without decoding them."""
+    print(f'Copying frames to: {out_path} (store)')
+    source = frames[0][0]
+    with FrameStoreWriter(out_path, source.mode, scale=source.scale) as store:
+        for _, i in frames:
+            store.append_encoded(source.read_encoded(i))
+    return frames
 
+def read_frame(frame):
+    """Decode a frame reference: a JPEG path or a (store, index) pair."""
+    if isinstance(frame, tuple):
+        store, i = frame
+        return store.read(i)
+    return cv2.imread(frame)
+
+# Tiles of the combined video: webcam1 | webcam2 on top, aria (centered) | screen at the bottom
+COMBINED_TILES = [((slice(None, 720), slice(None, 1280)), (1280, 720)),
+                  ((slice(None, 720), slice(1280, None)), (1280, 720)),
+                  ((slice(720, None), slice(280, 1000)), (720, 720)),
+                  ((slice(720, None), slice(1280, None)), (1280, 720))]
+
+def combine_frames(webcam1, webcam2, aria, screen=None, canvas=None, pool=None):
+    """Compose the combined frame. Pass the previous canvas to reuse its buffer and a thread pool to resize in parallel."""
+    if canvas is None:
+        canvas = np.zeros((COMBINED_RESOLUTION[1], COMBINED_RESOLUTION[0], 3), dtype=np.uint8)
+
+    def paste(tile):
+        img, (region, size) = tile
+        canvas[region] = cv2.resize(img, size)
+
+    # Screen is either always present or always missing for a session, so the reused canvas never shows stale tiles
+    tiles = [(img, tile) for img, tile in zip([webcam1, webcam2, aria, screen], COMBINED_TILES) if img is not None]
+    if pool is None:
+        for tile in tiles:
+            paste(tile)
+    else:
+        # cv2.resize releases the GIL and each tile writes its own region of the canvas
+        list(pool.map(paste, tiles))
+
+    return canvas
+
+def create_synced_videos(desc_video_path, streams, workers=4, encoder=None):
+    """Write <name>.mp4 for every stream and combined.mp4, reading each frame of streams (name -> frame paths or
+    (store, index) pairs) once."""
+    names = list(streams)
+    num_frames = min(len(frames) for frames in streams.values())
+    writers = {}
+    encoder = encoder or {}
+    combined = open_writer(os.path.join(desc_video_path, 'combined.mp4'), COMBINED_RESOLUTION, **encoder)
+    canvas = None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def read(i):
+            return [pool.submit(read_frame, streams[name][i]) for name in names]
+
+        # Decode the next synced index while the current one is resized and encoded
+        pending = read(0) if num_frames else []
+        failed = True
         try:
-            os.makedirs(desc_video_path)
-            for name in ['webcam1', 'webcam2', 'aria', 'screen']:
+            for i in range(num_frames):
+                frames = dict(zip(names, [future.result() for future in pending]))
+                if i + 1 < num_frames:
+                    pending = read(i + 1)
+
+                for name in names:
+                    img = frames[name]
+                    if name not in writers:
+                        print(f'Creating video: {os.path.join(desc_video_path, f"{name}.mp4")}')
+                        writers[name] = open_writer(os.path.join(desc_video_path, f'{name}.mp4'), (img.shape[1], img.shape[0]),
+                                                **encoder)
+                    writers[name].write(img)
+
+                canvas = combine_frames(frames['webcam1'], frames['webcam2'], frames['aria'], frames.get('screen'),
+                                        canvas=canvas, pool=pool)
+                combined.write(canvas)
+            failed = False
+        finally:
+            # Every writer is released (no orphaned ffmpeg), release errors never hide the error being raised
+            release_all(list(writers.values()) + [combined], raise_error=not failed)
+
+class VideoReader:
+    """Frames of a video by non-decreasing frame number, every frame decoded at most once (skipped frames are only
+    grabbed, a repeated frame number returns the same frame)."""
+
+    def __init__(self, path, start):
+        self.cap = open_video(path, start)
+        self.position = start  # frame number of the next read
+        self.frame = None
+
+    def read(self, frame_number):
+        while self.position < frame_number:
+            if not self.cap.grab():
+                return None
+            self.position += 1
+        if self.position == frame_number:
+            ret, self.frame = self.cap.read()
+            self.position += 1
+            if not ret:
+                self.frame = None
+        return self.frame
+
+    def release(self):
+        self.cap.release()
+
+def video_frame_count(path):
+    cap = cv2.VideoCapture(path)
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return count
+
+def sync_from_video(row, session_path, desc_video_path, desc_frame_path=None, workers=4, encoder=None, store=None,
+                    align='index', ffprobe='ffprobe'):
+    """Write every synced video (and the rgb_frames when desc_frame_path is given, as frame stores when store is jpeg or
+    raw) in one pass over the sources, following the alignment table (see alignment.py)."""
+    obs_path = os.path.join(session_path, 'obs.mp4')
+    aria_path = os.path.join(session_path, 'aria.mp4')
+
+    start_webcam2, start_aria, start_screen, end_webcam2 = map(int, row[3:7])
+    print(f'Start webcam2: {start_webcam2}, End webcam2: {end_webcam2}, Start aria: {start_aria}, Start screen: {start_screen}')
+
+    n_obs_frames = video_frame_count(obs_path)
+    counts = {'webcam1': n_obs_frames, 'webcam2': n_obs_frames, 'screen': n_obs_frames,
+              'aria': video_frame_count(aria_path)}
+    table = build_alignment(row, session_path, counts, align, ffprobe)
+    num_frames = len(table)
+    print(f'Number of synced frames: {num_frames}')
+    if not num_frames:
+        save_alignment(os.path.join(desc_video_path, ALIGNMENT_FILE), table)
+        return
+
+    streams = ['webcam1', 'webcam2', 'aria']
+    obs_reader = VideoReader(obs_path, table[0, 1])
+    aria_reader = VideoReader(aria_path, table[0, 2])
+    screen_reader = None
+    if start_screen != 0:
+        # Screen lives in the same OBS video but has its own sync frame, so it needs a second read position
+        screen_reader = obs_reader if np.array_equal(table[:, 3], table[:, 1]) else VideoReader(obs_path, table[0, 3])
+        streams.append('screen')
+
+    writers = {}
+    encoder = encoder or {}
+    combined = open_writer(os.path.join(desc_video_path, 'combined.mp4'), COMBINED_RESOLUTION, **encoder)
+    stores = {}
+    if desc_frame_path and store:
+        stores = {name: FrameStoreWriter(store_path(os.path.join(desc_frame_path, name)), store) for name in streams}
+    pool = ThreadPoolExecutor(max_workers=workers)
+    canvas = None
+
+    written = 0
+    failed = True
+    try:
+        for _, webcam2, aria_frame_number, screen in table:
+            obs_frame = obs_reader.read(webcam2)
+            frames = {'webcam1': obs_frame, 'webcam2': obs_frame, 'aria': aria_reader.read(aria_frame_number)}
+            if screen_reader is not None:
+                frames['screen'] = screen_reader.read(screen)
+
+            if any(frame is None for frame in frames.values()):
+                print(f'[WARNING] Source ended early at synced frame {written}')
+                break
+
+            for name in ['webcam1', 'webcam2', 'screen']:
+                if name in frames:
+                    frames[name] = frames[name][OBS_CROPS[name]]
+
+            for name in streams:
+                img = frames[name]
+                if name not in writers:
+                    print(f'Creating video: {os.path.join(desc_video_path, f"{name}.mp4")}')
+                    writers[name] = open_writer(os.path.join(desc_video_path, f'{name}.mp4'), (img.shape[1], img.shape[0]),
+                                                **encoder)
+                writers[name].write(img)
+                if name in stores:
+                    stores[name].append(img)
+                elif desc_frame_path:
+                    cv2.imwrite(os.path.join(desc_frame_path, name, f'{written:08d}.jpg'), img)
+
+            canvas = combine_frames(*[frames[name] for name in streams], canvas=canvas, pool=pool)
+            combined.write(canvas)
+            written += 1
+
+        for frame_store in stores.values():
+            frame_store.close()
+        failed = False
+    finally:
+        pool.shutdown()
+        obs_reader.release()
+        aria_reader.release()
+        if screen_reader is not None and screen_reader is not obs_reader:
+            screen_reader.release()
+        # Every writer is released (no orphaned ffmpeg), release errors never hide the error being raised
+        release_all(list(writers.values()) + [combined], raise_error=not failed)
+
+    # Frame counts of the container are estimates, the table only lists the frames that were written
+    save_alignment(os.path.join(desc_video_path, ALIGNMENT_FILE), table[:written])
+    print(f'Wrote {written} synced frames')
+
+
+def process_session(row, input_dir, output_dir, source='frames', rgb_frames=True, copy='copy', workers=4,
+                    encoder=None, with_hash=False, force=False, store=None, align='index',
+                    ffprobe='ffprobe'):
+    session_path = os.path.join(*([input_dir] + row[:3]))
+    base_path = os.path.join(session_path, 'frames')
+    desc_path = os.path.join(*([output_dir] + row[1:3]))
+    desc_video_path = os.path.join(desc_path, 'videos')
+    desc_frame_path = os.path.join(desc_path, 'rgb_frames')
+    write_frames = rgb_frames or source == 'frames'
+
+    # Everything that changes the synced output. Workers only change the speed
+    params = {'row': row[3:7], 'source': source, 'rgb_frames': write_frames, 'copy': copy, 'encoder': encoder or {}}
+    names = ['webcam1', 'webcam2', 'aria', 'screen']
+    if source == 'video':
+        inputs = [os.path.join(session_path, 'obs.mp4'), os.path.join(session_path, 'aria.mp4')]
+        stored = {name: bool(store) for name in names}
+        params['store'] = store
+    else:
+        # Each stream is read from a frame store when video_to_frames.py wrote one, and rgb_frames mirrors it
+        stored = {name: is_frame_store(store_path(os.path.join(base_path, name))) for name in names}
+        inputs = [stored_path(os.path.join(base_path, name), stored[name]) for name in names]
+    if align != 'index':
+        # Index alignment keeps the params of sessions synced before alignment modes existed
+        params['align'] = align
+        inputs += [os.path.join(session_path, name) for name in ['obs.mp4', 'aria.mp4', ARIA_TIMESTAMPS]
+                   if os.path.join(session_path, name) not in inputs]
+    outputs = [desc_video_path]
+    if write_frames:
+        outputs += [stored_path(os.path.join(desc_frame_path, name), stored[name]) for name in names]
+
+    print('-'*80)
+    manifest = Manifest(desc_path, with_hash)
+    if not force and manifest.is_fresh('sync', inputs, params, outputs):
+        print(f'Folder {desc_path} is up to date. Skipping...')
+        return
+    # Synced before manifests existed: kept as they are, like the annotations
+    if not force and 'sync' not in manifest.stages and os.path.exists(desc_video_path):
+        print(f'Folder {desc_path} already exists, recording it as done. Skipping...')
+        manifest.finish('sync', inputs, params, outputs)
+        return
+
+    print(f'Processing {session_path if source == "video" else base_path}...')
+    # Half-finished or stale: start over, annotations next to the videos are kept
+    for path in [desc_video_path, desc_frame_path]:
+        if os.path.exists(path):
+            print(f'Removing stale {path}')
+            shutil.rmtree(path)
+
+    os.makedirs(desc_video_path)
+    if write_frames:
+        for name in names:
+            if not stored[name]:
                 os.makedirs(os.path.join(desc_frame_path, name))
-        except FileExistsError:
-            print(f'Folder {desc_path} already exists. Skipping...')
-            continue
 
-        all_webcam1 = [os.path.join(base_path, 'webcam1', x) for x in sorted(os.listdir(os.path.join(base_path, "webcam1")))]
-        all_webcam2 = [os.path.join(base_path, 'webcam2', x) for x in sorted(os.listdir(os.path.join(base_path, "webcam2")))]
-        all_aria = [os.path.join(base_path, 'aria', x) for x in sorted(os.listdir(os.path.join(base_path, "aria")))]
-        all_screen = [os.path.join(base_path, 'screen', x) for x in sorted(os.listdir(os.path.join(base_path, "screen")))]
-
-        start_webcam2, start_aria, start_screen, end_webcam2 = map(int, row[3:7])
-        # Handle if there is end webcam2 screen annotation
-        if end_webcam2 == 0:
-            n_webcam2_frames = len(all_webcam2)
+    manifest.start('sync', inputs, params)
+    if source == 'video':
+        sync_from_video(row, session_path, desc_video_path, desc_frame_path if rgb_frames else None, workers, encoder,
+                        store, align, ffprobe)
+    else:
+        sync_from_frames(row, base_path, desc_video_path, desc_frame_path, copy, workers, encoder, align, ffprobe)
+    manifest.finish('sync', inputs, params, outputs)
+
+
+def stored_path(folder, stored):
+    return store_path(folder) if stored else folder
+
+def list_extracted(folder):
+    """Frame paths of a video_to_frames folder indexed by frame number, None for frames that were not extracted (a
+    window extraction may not start at 0). (store, index) pairs instead of paths when the frames are in a frame
+    store."""
+    if is_frame_store(store_path(folder)):
+        store = FrameStore(store_path(folder))
+        return [None] * store.start + [(store, i) for i in range(len(store))]
+
+    numbers = {int(x[:-4]) for x in os.listdir(folder) if x.endswith('.jpg')}
+    if not numbers:
+        return []
+    return [os.path.join(folder, f'{i:08d}.jpg') if i in numbers else None for i in range(max(numbers) + 1)]
+
+def sync_from_frames(row, base_path, desc_video_path, desc_frame_path, copy='copy', workers=4, encoder=None,
+                     align='index', ffprobe='ffprobe'):
+    extracted = {name: list_extracted(os.path.join(base_path, name)) for name in ALIGN_STREAMS}
+
+    start_webcam2, start_aria, start_screen, end_webcam2 = map(int, row[3:7])
+    print(f'Start webcam2: {start_webcam2}, End webcam2: {end_webcam2}, Start aria: {start_aria}, Start screen: {start_screen}')
+
+    # frames/ is next to obs.mp4 and aria.mp4, whose timestamps are used with --align timestamps
+    table = build_alignment(row, os.path.dirname(base_path), {name: len(frames) for name, frames in extracted.items()},
+                            align, ffprobe)
+    print(f'Number of synced frames: {len(table)}')
+
+    streams = {name: [extracted[name][i] for i in table[:, col]] for col, name in enumerate(ALIGN_STREAMS)
+               if name != 'screen' or start_screen != 0}
+
+    # Every selected frame is checked before anything is written, a gap anywhere in the window fails here
+    missing = {name: int(table[frames.index(None), col]) for col, name in enumerate(ALIGN_STREAMS)
+               if name in streams and None in (frames := streams[name])}
+    if missing:
+        raise FileNotFoundError(f'Frames of the synced window were not extracted (first missing frame per stream: '
+                                f'{missing}), extract them with video_to_frames.py --csv')
+    save_alignment(os.path.join(desc_video_path, ALIGNMENT_FILE), table)
+
+    # Per-stream videos and the combined video share a single read of every frame
+    create_synced_videos(desc_video_path, streams, workers, encoder)
+    for name, frames in streams.items():
+        if frames and isinstance(frames[0], tuple):
+            copy_store(store_path(os.path.join(desc_frame_path, name)), frames)
         else:
-            n_webcam2_frames = min(len(all_webcam2), end_webcam2)
-
-        print(f'Start webcam2: {start_webcam2}, End webcam2: {end_webcam2}, Start aria: {start_aria}, Start screen: {start_screen}')
+            copy_frame(os.path.join(desc_frame_path, name), frames, copy)
+
+def video_fps(path):
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+    # Unreadable or missing video: 0 or -1 depending on the OpenCV version
+    return fps if fps > 0 else 30.0
+
+def sidecar_row(session_path):
+    """CSV sync columns [start_webcam2, start_aria, start_screen, end_webcam2] estimated from the recorder sidecar.
+    Frame 0 of each video is taken at the middle of its start command and acknowledgement, the beeps give the sync
+    frames. Screen is left to 0."""
+    with open(os.path.join(session_path, SIDECAR_FILE)) as f:
+        events = json.load(f)['events']
+    start = {e['device']: e for e in events if e['command'] == 'start' and e['error'] is None}
+    beeps = [e['mono_ns'] for e in events if e['command'] == 'beep']
+    if not {'obs', 'aria'} <= set(start) or not beeps:
+        raise ValueError(f'{SIDECAR_FILE} of {session_path} has no start of both devices or no beep')
+
+    def frame(device, t, fps):
+        command = start[device]
+        return round((t - (command['sent_mono_ns'] + command['ack_mono_ns']) / 2) / 1e9 * fps)
+
+    obs_fps = video_fps(os.path.join(session_path, 'obs.mp4'))
+    aria_fps = video_fps(os.path.join(session_path, 'aria.mp4'))
+    uncertainty = max(start[d]['ack_mono_ns'] - start[d]['sent_mono_ns'] for d in ['obs', 'aria']) / 2e9
+    print(f'[INFO] Sidecar estimate of {session_path} is within +/-{round(uncertainty * obs_fps)} frames')
+
+    end_webcam2 = frame('obs', beeps[-1], obs_fps) if len(beeps) > 1 else 0
+    return [frame('obs', beeps[0], obs_fps), frame('aria', beeps[0], aria_fps), 0, end_webcam2]
+
+def add_sidecar_rows(rows, input_dir):
+    """Append the sidecar estimate of every session missing from rows and compare it with the existing rows."""
+    known = {tuple(row[:3]): row for row in rows}
+    for sidecar in sorted(glob(os.path.join(input_dir, '*', '*', '*', SIDECAR_FILE))):
+        session_path = os.path.dirname(sidecar)
+        key = tuple(os.path.relpath(session_path, input_dir).split(os.sep))
+        try:
+            estimate = sidecar_row(session_path)
+        except (ValueError, KeyError, OSError) as e:
+            print(f'[WARNING] {e}')
+            continue
 
-        if start_screen == 0:
-            # Sync frame for screen is not available.
-            num_frames = min(n_webcam2_frames - start_webcam2, len(all_aria) - start_aria)
-            screen_frames = None
+        if key in known:
+            current = list(map(int, known[key][3:7]))
+            # Only the offset between the streams matters, the beep frame itself is picked by hand
+            offset, estimated_offset = current[1] - current[0], estimate[1] - estimate[0]
+            print(f'[INFO] {"/".join(key)}: aria - webcam2 offset CSV {offset}, sidecar {estimated_offset}')
         else:
-            num_frames = min(n_webcam2_frames - start_webcam2, len(all_aria) - start_aria, len(all_screen) - start_screen)
-            screen_frames = create_video(os.path.join(desc_video_path, 'screen.mp4'), all_screen[start_screen:start_screen+num_frames])
-            copy_frame(os.path.join(desc_frame_path, 'screen'), screen_frames)
-
-        print(f'Number of synced frames: {num_frames}')
-        webcam1_frames = create_video(os.path.join(desc_video_path, 'webcam1.mp4'), all_webcam1[start_webcam2:start_webcam2+num_frames])
-        copy_frame(os.path.join(desc_frame_path, 'webcam1'), webcam1_frames)
-
-        webcam2_frames = create_video(os.path.join(desc_video_path, 'webcam2.mp4'), all_webcam2[start_webcam2:start_webcam2+num_frames])
-        copy_frame(os.path.join(desc_frame_path, 'webcam2'), webcam2_frames)
-
-        aria_frames = create_video(os.path.join(desc_video_path, 'aria.mp4'), all_aria[start_aria:start_aria+num_frames])
-        copy_frame(os.path.join(desc_frame_path, 'aria'), aria_frames)
-
-        # Create combined video
-        create_combined_video(os.path.join(desc_video_path, 'combined.mp4'), webcam1_frames, webcam2_frames, aria_frames, screen_frames)
+            print(f'[INFO] {"/".join(key)}: not in the CSV, using the sidecar estimate {estimate}')
+            rows.append(list(key) + list(map(str, estimate)))
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    # Open the file
+    with open(args.csv, mode='r') as file:
+        csv_reader = csv.reader(file)  # Create a CSV reader object
+        rows = [row for row in csv_reader if row]
+
+    if args.sidecar:
+        add_sidecar_rows(rows, args.input)
+
+    sessions = [(session_name(*row[:3]),
+                 (row, args.input, args.output, args.source, not args.no_rgb_frames, args.copy, args.workers,
+                  writer_config(args), args.hash, args.force, args.store, args.align,
+                  args.ffprobe))
+                for row in rows]
+    exit_on_failure(run_sessions(process_session, sessions, args.jobs, args.log_dir))
@@ -0,0 +1,108 @@
+"""
+Huy Anh Nguyen
+CS PhD @Stony Brook University @University of Adelaide
+
+Created Jan 22, 2025
+---------------------
+Compact touch annotation format shared by annotate_webcam.py, annotate_screen.py and their readers.
+
+<session>/<stream>_touch_annotation.npz holds the per-frame 0/1 labels bit-packed (frame i = synced frame
+%08d.jpg) plus the search bbox. The old <stream>_touch_annotation.json ({'bbox': ..., 'annotations': {frame_name: 0/1}})
+is still written next to it for compatibility unless --no-json is given, and load_annotation() reads both:
+    labels, bbox = load_annotation(session_dir, 'webcam2')   # np.uint8 array indexed by frame number
+
+Usage (export an existing npz to the old JSON format):
+python touch_annotation.py [path_to_npz] ...
+"""
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+def annotation_path(session_dir, stream, ext='npz'):
+    return Path(session_dir).joinpath(f'{stream}_touch_annotation.{ext}')
+
+
+def annotation_outputs(session_dir, stream, export_json=True):
+    """Files written by save_annotation."""
+    return [annotation_path(session_dir, stream, ext) for ext in (['npz', 'json'] if export_json else ['npz'])]
+
+
+def annotation_exists(session_dir, stream):
+    return annotation_path(session_dir, stream, 'npz').exists() or annotation_path(session_dir, stream, 'json').exists()
+
+
+def to_json(labels, bbox=None):
+    """Old JSON layout: one '%08d.jpg' key per frame."""
+    return {'bbox': None if bbox is None else [int(x) for x in bbox],
+            'annotations': {f'{i:08d}.jpg': int(label) for i, label in enumerate(labels)}}
+
+
+def save_annotation(session_dir, stream, labels, bbox=None, export_json=True):
+    labels = np.asarray(labels, dtype=np.uint8)
+    np.savez(annotation_path(session_dir, stream, 'npz'),
+             labels=np.packbits(labels), num_frames=len(labels),
+             bbox=np.array([] if bbox is None else bbox, dtype=np.int32))
+
+    if export_json:
+        with open(annotation_path(session_dir, stream, 'json'), 'w') as f:
+            json.dump(to_json(labels, bbox), f, indent=4)
+
+
+def read_annotation(path):
+    """Read a .npz or legacy .json annotation file. Return (labels, bbox)."""
+    path = Path(path)
+    if path.suffix == '.npz':
+        with np.load(path) as data:
+            labels = np.unpackbits(data['labels'], count=int(data['num_frames']))
+            bbox = tuple(data['bbox'].tolist()) or None
+        return labels, bbox
+
+    with open(path) as f:
+        res = json.load(f)
+
+    annotations = res['annotations']
+    labels = np.zeros(len(annotations), dtype=np.uint8)
+    for frame_name, label in annotations.items():
+        labels[int(Path(frame_name).stem)] = label
+
+    return labels, None if res['bbox'] is None else tuple(res['bbox'])
+
+
+def touch_segments(labels, min_frames=1, max_gap=0):
+    """Run-length encode 0/1 labels into [start, end) frame segments of touch.
+    Segments separated by at most max_gap non-touch frames are merged, then segments shorter than min_frames dropped."""
+    padded = np.concatenate([[0], np.asarray(labels, dtype=np.int8) != 0, [0]])
+    edges = np.diff(padded.astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    if max_gap > 0 and len(starts) > 1:
+        keep = (starts[1:] - ends[:-1]) > max_gap
+        starts = starts[np.concatenate([[True], keep])]
+        ends = ends[np.concatenate([keep, [True]])]
+
+    long_enough = (ends - starts) >= min_frames
+    return np.stack([starts[long_enough], ends[long_enough]], axis=1)
+
+
+def load_annotation(session_dir, stream):
+    """Load the annotation of a session, preferring the compact file. Return (labels, bbox)."""
+    path = annotation_path(session_dir, stream, 'npz')
+    if not path.exists():
+        path = annotation_path(session_dir, stream, 'json')
+    return read_annotation(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export compact touch annotations to the old JSON format')
+    parser.add_argument('files', type=str, nargs='+', help='Path to *_touch_annotation.npz files')
+    args = parser.parse_args()
+
+    for npz in map(Path, args.files):
+        labels, bbox = read_annotation(npz)
+        with open(npz.with_suffix('.json'), 'w') as f:
+            json.dump(to_json(labels, bbox), f, indent=4)
+        print(f'[INFO] {npz} -> {npz.with_suffix(".json")}')
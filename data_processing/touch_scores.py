@@ -0,0 +1,142 @@
+"""
+Huy Anh Nguyen
+CS PhD @Stony Brook University @University of Adelaide
+
+Created Feb 6, 2025
+---------------------
+Per-frame touch scores kept by annotate_webcam.py and annotate_screen.py, and the temporal filter turning them into
+labels.
+
+<session>/<stream>_touch_scores.npy holds, for every frame, the number of pixels in the LED / crosshair color range
+(float32, counted at full resolution: counts of reduced or downscaled frames are multiplied by the area factor).
+Labels are derived from it by clean_labels():
+    - median: median filter of that many frames over the scores (1 = off)
+    - on / off: hysteresis, a touch starts at a score >= on and lasts until the score drops below off (default on)
+    - min_frames: touches shorter than this are dropped
+The defaults (on 1, no median, min_frames 1) give the labels of a plain count > 0 test, as before.
+
+The annotators take the same filter arguments. To change them afterwards without decoding a single frame, relabel the
+annotated sessions from their scores:
+python touch_scores.py -i [path_to_data_folder] -s webcam2 --on 20 --off 5 --min-frames 3 --median 3
+The annotation files are rewritten and the annotate_<stream> manifest entry is updated, so the annotators keep
+skipping these sessions as long as they are run with the same filter.
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from manifest import Manifest, add_manifest_args
+from touch_annotation import annotation_outputs, load_annotation, save_annotation, touch_segments
+
+FILTER_DEFAULTS = {'on': 1.0, 'off': None, 'min_frames': 1, 'median': 1}
+
+
+def scores_path(session_dir, stream):
+    return Path(session_dir).joinpath(f'{stream}_touch_scores.npy')
+
+
+def save_scores(session_dir, stream, scores):
+    np.save(scores_path(session_dir, stream), np.asarray(scores, dtype=np.float32))
+
+
+def load_scores(session_dir, stream):
+    return np.load(scores_path(session_dir, stream))
+
+
+def add_filter_args(parser):
+    parser.add_argument('--on', type=float, default=FILTER_DEFAULTS['on'],
+                        help='Touch starts when the number of in-range pixels reaches this')
+    parser.add_argument('--off', type=float, default=FILTER_DEFAULTS['off'],
+                        help='Touch ends when the number of in-range pixels drops below this, default --on')
+    parser.add_argument('--min-frames', type=int, default=FILTER_DEFAULTS['min_frames'],
+                        help='Drop touches shorter than this (frames)')
+    parser.add_argument('--median', type=int, default=FILTER_DEFAULTS['median'],
+                        help='Median filter the scores over this many frames first (odd, 1 = off)')
+
+
+def filter_params(args):
+    """Filter arguments that differ from the defaults, so manifests of unfiltered annotations stay fresh."""
+    params = {key: getattr(args, key) for key in FILTER_DEFAULTS}
+    if params['median'] % 2 == 0:
+        raise ValueError(f'--median must be odd, got {params["median"]}')
+    return {} if params == FILTER_DEFAULTS else {'filter': params}
+
+
+def median_filter(scores, width):
+    if width <= 1 or len(scores) == 0:
+        return scores
+    padded = np.pad(scores, width // 2, mode='edge')
+    return np.median(sliding_window_view(padded, width), axis=1).astype(scores.dtype)
+
+
+def hysteresis(scores, on, off=None):
+    """1 from a score >= on until the score drops below off."""
+    off = on if off is None else min(off, on)
+    # Frames in between keep the state of the last frame that was clearly on or off
+    decided = (scores >= on) | (scores < off)
+    last = np.maximum.accumulate(np.where(decided, np.arange(len(scores)), -1))
+    return np.where(last >= 0, scores[np.maximum(last, 0)] >= on, False).astype(np.uint8)
+
+
+def clean_labels(scores, on=1.0, off=None, min_frames=1, median=1):
+    """0/1 labels from per-frame scores (see the module docstring)."""
+    scores = median_filter(np.asarray(scores, dtype=np.float32), median)
+    labels = hysteresis(scores, on, off)
+    if min_frames <= 1:
+        return labels
+
+    segments = touch_segments(labels, min_frames)
+    delta = np.zeros(len(labels) + 1, dtype=np.int32)
+    delta[segments[:, 0]] += 1
+    delta[segments[:, 1]] -= 1
+    return (np.cumsum(delta[:-1]) > 0).astype(np.uint8)
+
+
+def relabel(session_dir, stream, args):
+    """Rewrite the annotation of an up to date annotate_<stream> stage from its scores. Return False if stale."""
+    stage = f'annotate_{stream}'
+    manifest = Manifest(session_dir, args.hash)
+    entry = manifest.stages.get(stage)
+    scores_file = scores_path(session_dir, stream)
+    # Scores must come from the current input frames
+    if entry is None or str(scores_file) not in entry['outputs'] or \
+            not manifest.is_fresh(stage, entry['inputs'], entry['params'], entry['outputs']):
+        return False
+
+    params = {key: value for key, value in entry['params'].items() if key != 'filter'}
+    params.update(filter_params(args))
+    export_json = str(annotation_outputs(session_dir, stream, True)[1]) in entry['outputs']
+    outputs = annotation_outputs(session_dir, stream, export_json) + [scores_file]
+    if not args.force and manifest.is_fresh(stage, entry['inputs'], params, outputs):
+        print(f'[INFO] {outputs[0]} already uses this filter. Skipping...')
+        return True
+
+    scores = load_scores(session_dir, stream)
+    _, bbox = load_annotation(session_dir, stream)
+    labels = clean_labels(scores, args.on, args.off, args.min_frames, args.median)
+    save_annotation(session_dir, stream, labels, bbox, export_json=export_json)
+    # Same inputs, still fingerprinted as when the scores were computed
+    manifest.update_outputs(stage, params, outputs)
+
+    pos_cnt = int(np.count_nonzero(labels))
+    print(f'[INFO] {outputs[0]} Touch: {pos_cnt} Non-touch: {len(labels) - pos_cnt}')
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Relabel annotated sessions from their touch scores')
+    parser.add_argument('-i', '--input', type=str, default='/Volumes/SK_APFS/Touch_Dataset/New_Dataset/Data',
+                        help='Path to the synced data folder')
+    parser.add_argument('-s', '--stream', type=str, default='webcam2', help='Annotated stream (webcam2, screen, ...)')
+    add_filter_args(parser)
+    add_manifest_args(parser)
+    args = parser.parse_args()
+    filter_params(args)
+
+    all_scores = sorted(Path(args.input).glob(f'*/*/{args.stream}_touch_scores.npy'))
+    print(f'[INFO] Total {len(all_scores)} scored sessions...')
+    stale = [str(path.parent) for path in all_scores if not relabel(path.parent, args.stream, args)]
+    if stale:
+        print(f'[WARNING] Annotation out of date or without scores, run the annotator again: {stale}')
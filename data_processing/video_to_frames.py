@@ -22,62 +22,287 @@ Dec30
 
 Usage:
 python video_to_frames.py -i [path_to_data_folder]
+
+JPEG encoding of the 3 crops is the bottleneck on long sessions. Use --workers N to decode on the main thread and
+hand the crops to N encoder/writer threads through a bounded queue (cv2.imwrite releases the GIL):
+python video_to_frames.py -i [path_to_data_folder] --workers 6
+
+Extraction resumes after the last complete frame already on disk (use --no-resume to rewrite everything). Frames are
+named by their frame number in the video, so a window can be extracted with --start/--end, or only the synced window
+of every session with --csv [csv_sync_file] (see sync_vids.py):
+python video_to_frames.py -i [path_to_data_folder] --csv [csv_sync_file]
+
+Sessions can also be processed in parallel, each with its own log file:
+python video_to_frames.py -i [path_to_data_folder] --jobs 4 --log-dir [path_to_log_folder]
+
+Videos already extracted are skipped (see manifest.py), use --force to extract again.
+
+Instead of one JPEG per frame, frames can be written to a memory-mapped frame store (frames/<stream>.frames, see
+frame_store.py) as JPEG blobs or raw (optionally downscaled) arrays. sync_vids.py and the annotators read either layout:
+python video_to_frames.py -i [path_to_data_folder] --store jpeg --workers 6
+python video_to_frames.py -i [path_to_data_folder] --store raw --store-scale 2
 """
 
 import argparse
+import csv
 import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
+from pathlib import Path
 
 import cv2
 
+from frame_store import FrameStoreWriter, store_path
+from manifest import Manifest, add_manifest_args
+from scheduler import add_scheduler_args, exit_on_failure, run_sessions, session_name
+
 parser = argparse.ArgumentParser(description='Convert multiple streams video from OBS to 3 separate folders of frames.')
 parser.add_argument('-i', '--input', type=str, help='Path to the collected data folder')
 parser.add_argument('-v', '--video', type=str, help='Path to a single video file')
-args = parser.parse_args()
+parser.add_argument('-w', '--workers', type=int, default=0,
+                    help='Number of encoder/writer threads. 0 writes the crops serially on the decode thread')
+parser.add_argument('--start', type=int, default=0, help='First frame to extract')
+parser.add_argument('--end', type=int, default=None, help='Stop before this frame (default: end of the video)')
+parser.add_argument('-c', '--csv', type=str, default=None,
+                    help='Only extract the synced window of each session listed in this manual_sync.csv')
+parser.add_argument('--no-resume', action='store_true', help='Rewrite frames that already exist')
+parser.add_argument('--store', type=str, default=None, choices=['jpeg', 'raw'],
+                    help='Write a frame store (<stream>.frames) of JPEG blobs or raw arrays instead of JPEG files')
+parser.add_argument('--store-scale', type=int, default=1, help='Downscale factor of the frames in the store')
+add_manifest_args(parser)
+add_scheduler_args(parser)
 
 # args.input = 'SOMETIME' # for manual run
 
-def main(vid):
-    print(f'Processing {vid}')
+# (rows, cols) of each stream inside the 3840x2160 OBS canvas
+OBS_CROPS = {'webcam1': (slice(None, 1080), slice(None, 1920)),
+             'webcam2': (slice(None, 1080), slice(1920, None)),
+             'screen': (slice(1080, None), slice(None, 1920))}
+
+JPEG_EOI = b'\xff\xd9'
+RESUME_CHECK = 64  # frames before the resume point verified, writer threads finish frames out of order
+
+def open_video(path, start=0):
+    """Open a video and position it so the next read() returns frame number start."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f'Cannot open {path}')
+
+    if start > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start:
+            # Seeking is not frame accurate for this file, skip frames without decoding them to BGR instead
+            print(f'[WARNING] Inaccurate seek in {path}, grabbing {start} frames instead')
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            for _ in range(start):
+                if not cap.grab():
+                    break
+
+    return cap
+
+def is_complete_jpeg(path):
+    try:
+        with open(path, 'rb') as f:
+            f.seek(-2, os.SEEK_END)
+            return f.read(2) == JPEG_EOI
+    except OSError:
+        return False
+
+def resume_point(out_dirs, start, end=None):
+    """First frame of [start, end) that is missing or truncated in any of out_dirs."""
+    first = end
+    for out_dir in out_dirs:
+        existing = {int(name[:-4]) for name in os.listdir(out_dir) if name.endswith('.jpg') and name[:-4].isdigit()}
+        idx = start
+        while idx in existing and (end is None or idx < end):
+            idx += 1
+
+        # An interrupted run can leave the last frames half written
+        for check in range(idx - 1, max(start, idx - RESUME_CHECK) - 1, -1):
+            if not is_complete_jpeg(os.path.join(out_dir, f'{check:08d}.jpg')):
+                idx = check
+
+        first = idx if first is None else min(first, idx)
+
+    return first
+
+def sync_window(row, vid):
+    """(start, end) frames of vid used by sync_vids for this manual_sync.csv row."""
+    start_webcam2, start_aria, start_screen, end_webcam2 = map(int, row[3:7])
+    if 'aria.mp4' in vid:
+        return start_aria, (start_aria + end_webcam2 - start_webcam2) if end_webcam2 else None
+
+    # Screen has its own start in the same OBS video
+    starts = [start_webcam2] + ([start_screen] if start_screen else [])
+    return min(starts), (end_webcam2 + max(starts) - start_webcam2) if end_webcam2 else None
+
+def main(vid, workers=0, with_hash=False, force=False, start=0, end=None, resume=True, store=None, store_scale=1):
     dir_path = os.path.join(os.path.dirname(vid), 'frames')
-    os.makedirs(os.path.join(dir_path, 'webcam1'), exist_ok=True)
     webcam1_dir = os.path.join(dir_path, 'webcam1')
     webcam2_dir = os.path.join(dir_path, 'webcam2')
     screen_dir = os.path.join(dir_path, 'screen')
     aria_dir = os.path.join(dir_path, 'aria')
 
-    os.makedirs(webcam1_dir, exist_ok=True)
-    os.makedirs(webcam2_dir, exist_ok=True)
-    os.makedirs(screen_dir, exist_ok=True)
-    os.makedirs(aria_dir, exist_ok=True)
+    if store:
+        webcam1_dir, webcam2_dir, screen_dir, aria_dir = map(store_path, [webcam1_dir, webcam2_dir, screen_dir, aria_dir])
+    else:
+        os.makedirs(webcam1_dir, exist_ok=True)
+        os.makedirs(webcam2_dir, exist_ok=True)
+        os.makedirs(screen_dir, exist_ok=True)
+        os.makedirs(aria_dir, exist_ok=True)
+
+    if 'aria.mp4' in vid:
+        crops = [(aria_dir, (slice(None), slice(None)))]
+    else:
+        crops = [(webcam1_dir, OBS_CROPS['webcam1']),
+                 (webcam2_dir, OBS_CROPS['webcam2']),
+                 (screen_dir, OBS_CROPS['screen'])]
+
+    stage = f'frames_{os.path.splitext(os.path.basename(vid))[0]}'
+    outputs = [out_dir for out_dir, _ in crops]
+    params = {'start': start, 'end': end}
+    if store:
+        params.update({'store': store, 'store_scale': store_scale})
+    manifest = Manifest(os.path.dirname(vid), with_hash)
+    if not force and manifest.is_fresh(stage, [vid], params, outputs):
+        print(f'Frames of {vid} are up to date. Skipping...')
+        return
+
+    print(f'Processing {vid} (frames {start} to {"end" if end is None else end})')
+    manifest.start(stage, [vid], params)
 
-    # Read video
-    cap = cv2.VideoCapture(vid)
-    frame_count = 0
-    max_frames = 1e6 # modify this to limit the number of frames to be extracted for syncing purpose
+    # A store is rewritten as a whole, it cannot be appended to after an interruption
+    first = resume_point(outputs, start, end) if resume and not store else start
+    if first is not None and first > start:
+        print(f'Resuming at frame {first}')
+    if end is not None and first >= end:
+        print('All frames already extracted')
+    else:
+        # Read video
+        cap = open_video(vid, first)
 
+        t0 = time.perf_counter()
+        if store:
+            last = extract_store(cap, crops, first, end, workers, store, store_scale)
+        elif workers > 0:
+            last = extract_pipelined(cap, crops, first, end, workers)
+        else:
+            last = extract_serial(cap, crops, first, end)
+        cap.release()
+
+        elapsed = time.perf_counter() - t0
+        print(f"Extracted {last - first} frames in {elapsed:.1f}s ({(last - first) / max(elapsed, 1e-6):.1f} fps)")
+
+    manifest.finish(stage, [vid], params, outputs)
+
+def extract_serial(cap, crops, frame_count, end=None):
+    """Write frames frame_count, frame_count+1, ... until end or the end of the video. Return the last frame + 1."""
     # Read frames one by one
-    while frame_count < max_frames:
+    while end is None or frame_count < end:
         ret, frame = cap.read()  # ret: success flag, frame: the frame data
         if not ret:
-            print(f"Extracted {frame_count} frames")
             break
 
-        if 'aria.mp4' in vid:
-            cv2.imwrite(os.path.join(aria_dir, f'{frame_count:08d}.jpg'), frame)
-        else:
-            cv2.imwrite(os.path.join(webcam1_dir, f'{frame_count:08d}.jpg'), frame[:1080, :1920, :])
-            cv2.imwrite(os.path.join(webcam2_dir, f'{frame_count:08d}.jpg'), frame[:1080, 1920:, :])
-            cv2.imwrite(os.path.join(screen_dir, f'{frame_count:08d}.jpg'), frame[1080:, :1920, :])
+        for out_dir, crop in crops:
+            cv2.imwrite(os.path.join(out_dir, f'{frame_count:08d}.jpg'), frame[crop])
 
         frame_count += 1
 
-if args.video:
-    main(args.video)
-elif args.input:
-    all_videos = sorted(glob(os.path.join(args.input, '*', '*', '*.mp4')))
-    for vid in all_videos:
-        main(vid)
-else:
-    print('Please provide either --input or --video argument')
+    return frame_count
+
+def extract_pipelined(cap, crops, frame_count, end, workers):
+    # Bounded so a slow disk cannot make the decoder buffer the whole video in memory
+    jobs = queue.Queue(maxsize=4 * workers)
+    errors = []
+
+    def writer():
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            path, img = job
+            try:
+                if not cv2.imwrite(path, img):
+                    raise IOError(f'Failed to write {path}')
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=writer, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+
+    try:
+        while (end is None or frame_count < end) and not errors:
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            # cap.read() returns a new buffer every call, so the crop views stay valid until written
+            for out_dir, crop in crops:
+                jobs.put((os.path.join(out_dir, f'{frame_count:08d}.jpg'), frame[crop]))
+
+            frame_count += 1
+    finally:
+        for _ in threads:
+            jobs.put(None)
+        for t in threads:
+            t.join()
+
+    if errors:
+        raise errors[0]
+
+    return frame_count
+
+def extract_store(cap, crops, frame_count, end, workers, mode, scale):
+    writers = [(FrameStoreWriter(out_dir, mode, start=frame_count, scale=scale), crop) for out_dir, crop in crops]
+    pending = deque()
+
+    def flush(n):
+        # Encoding runs in threads (cv2 releases the GIL), appends stay in frame order
+        while len(pending) > n:
+            for (store, _), job in zip(writers, pending.popleft()):
+                store.append_encoded(job.result())
+
+    with ThreadPoolExecutor(max(1, workers)) as pool:
+        while end is None or frame_count < end:
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            pending.append([pool.submit(store.encode, frame[crop]) for store, crop in writers])
+            flush(4 * max(1, workers))
+            frame_count += 1
+        flush(0)
+
+    for store, _ in writers:
+        store.close()
+
+    return frame_count
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    if args.video:
+        main(args.video, args.workers, args.hash, args.force, args.start, args.end, not args.no_resume, args.store,
+             args.store_scale)
+    elif args.input:
+        all_videos = sorted(glob(os.path.join(args.input, '*', '*', '*.mp4')))
+        windows = {vid: (args.start, args.end) for vid in all_videos}
+        if args.csv:
+            with open(args.csv, mode='r') as file:
+                rows = {tuple(row[:3]): row for row in csv.reader(file) if row}
+            # Videos are <Day>/P/T/*.mp4, like the first 3 columns of the CSV
+            all_videos = [vid for vid in all_videos if tuple(Path(vid).parts[-4:-1]) in rows]
+            windows = {vid: sync_window(rows[tuple(Path(vid).parts[-4:-1])], vid) for vid in all_videos}
 
+        sessions = [(session_name(*Path(vid).relative_to(args.input).parts),
+                     (vid, args.workers, args.hash, args.force, *windows[vid], not args.no_resume, args.store,
+                      args.store_scale))
+                    for vid in all_videos]
+        exit_on_failure(run_sessions(main, sessions, args.jobs, args.log_dir))
+    else:
+        print('Please provide either --input or --video argument')
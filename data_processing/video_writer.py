@@ -0,0 +1,89 @@
+"""
+Huy Anh Nguyen
+CS PhD @Stony Brook University @University of Adelaide
+
+Created Jan 23, 2025
+---------------------
+Video writer backends used by sync_vids.py.
+    - opencv: cv2.VideoWriter with mp4v (no extra dependency, big files).
+    - ffmpeg: raw BGR frames are piped to an ffmpeg process on stdin (no temp files) and encoded with H.264 (libx264
+      by default, any ffmpeg encoder such as h264_videotoolbox or h264_nvenc can be given with --codec).
+
+Both expose the cv2.VideoWriter interface (write(frame) / release()), so callers only change how they open it:
+    out = open_writer(out_path, (width, height), fps=30.0, backend='ffmpeg', crf=23)
+Several writers are closed with release_all(), which releases all of them even when one ffmpeg process failed.
+"""
+import subprocess
+import sys
+
+import cv2
+
+
+def add_writer_args(parser):
+    parser.add_argument('--encoder', type=str, default='opencv', choices=['opencv', 'ffmpeg'],
+                        help='Video writer backend')
+    parser.add_argument('--codec', type=str, default='libx264', help='ffmpeg video encoder')
+    parser.add_argument('--preset', type=str, default='veryfast', help='ffmpeg encoder preset')
+    parser.add_argument('--crf', type=int, default=23, help='ffmpeg constant rate factor (lower is better quality)')
+    parser.add_argument('--encoder-threads', type=int, default=0, help='ffmpeg encoding threads, 0 lets ffmpeg decide')
+    parser.add_argument('--ffmpeg', type=str, default='ffmpeg', help='Path to the ffmpeg executable')
+
+
+def writer_config(args):
+    """Picklable writer options from parsed args, to be passed to open_writer(**config) in worker processes."""
+    return {'backend': args.encoder, 'codec': args.codec, 'preset': args.preset, 'crf': args.crf,
+            'threads': args.encoder_threads, 'ffmpeg': args.ffmpeg}
+
+
+class FFmpegWriter:
+    def __init__(self, out_path, frame_size, fps=30.0, codec='libx264', preset='veryfast', crf=23, threads=0,
+                 ffmpeg='ffmpeg'):
+        self.out_path = out_path
+        self.frame_size = tuple(frame_size)
+        command = [ffmpeg, '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{frame_size[0]}x{frame_size[1]}', '-r', str(fps),
+                   '-i', '-',
+                   '-an', '-c:v', codec, '-pix_fmt', 'yuv420p', '-threads', str(threads)]
+        if codec.startswith('libx26'):
+            command += ['-preset', preset, '-crf', str(crf)]
+        command += ['-movflags', '+faststart', out_path]
+
+        # Errors go to the current stdout, the session log under the scheduler's --log-dir
+        sys.stdout.flush()
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=sys.stdout, stderr=subprocess.STDOUT)
+
+    def write(self, frame):
+        if (frame.shape[1], frame.shape[0]) != self.frame_size:
+            raise ValueError(f'Frame size {frame.shape[1]}x{frame.shape[0]} does not match {self.frame_size} '
+                             f'for {self.out_path}')
+        self.process.stdin.write(frame.tobytes())
+
+    def release(self):
+        if self.process.stdin.closed:
+            return
+
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f'ffmpeg failed with code {self.process.returncode} while writing {self.out_path}')
+
+
+def release_all(writers, raise_error=True):
+    """Release every writer, even when some of them fail, then raise the first error. With raise_error=False (another
+    error is already propagating) the errors are only printed, so they do not hide it."""
+    errors = []
+    for writer in writers:
+        try:
+            writer.release()
+        except Exception as e:
+            print(f'[ERROR] {e}')
+            errors.append(e)
+    if errors and raise_error:
+        raise errors[0]
+
+
+def open_writer(out_path, frame_size, fps=30.0, backend='opencv', **kwargs):
+    if backend == 'ffmpeg':
+        return FFmpegWriter(out_path, frame_size, fps, **kwargs)
+
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    return cv2.VideoWriter(out_path, fourcc, fps, frame_size)
@@ -1,5 +1,6 @@
 
 import argparse
+import os
 import time
 
 import aria.sdk as aria
@@ -29,6 +30,13 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "--device-ip", help="IP address to connect to the device over wifi"
     )
+    parser.add_argument("--obs-host", default="localhost", help="Host of the OBS websocket server")
+    parser.add_argument("--obs-port", type=int, default=4455, help="Port of the OBS websocket server")
+    parser.add_argument(
+        "--obs-password-env",
+        default="OBS_PASSWORD",
+        help="Environment variable holding the OBS websocket password",
+    )
     return parser.parse_args()
 
 
@@ -55,7 +63,8 @@ def main():
     recording_config = aria.RecordingConfig()
     recording_config.profile_name = args.profile_name
     recording_manager.recording_config = recording_config
-    cl = obs.ReqClient(host='192.168.1.126', port=4455, password='XXXXXX', timeout=10)
+    cl = obs.ReqClient(host=args.obs_host, port=args.obs_port, password=os.environ.get(args.obs_password_env, ''),
+                       timeout=10)
 
     # 3. Start recording
     print(